@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+from collections import namedtuple
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import column, select, table as sql_table, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import partitions
+
+MAX_BULK_ROWS = 100_000
+
+async def read_rows(request: Request):
+    """Читает тело запроса как JSON-массив, CSV или multipart с CSV-файлом в поле "file".
+
+    Возвращает список пар (номер строки, dict): для CSV - номер строки в файле,
+    для JSON - позиция элемента в массиве начиная с 1.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected CSV file in 'file' field")
+        return _read_csv((await upload.read()).decode("utf-8-sig"))
+    if content_type.startswith("text/csv"):
+        return _read_csv((await request.body()).decode("utf-8-sig"))
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or CSV")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or CSV")
+    _check_size(len(items))
+    return list(enumerate(items, start=1))
+
+def _read_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    rows = []
+    for row in reader:
+        # Пустые ячейки CSV трактуем как отсутствующие значения
+        rows.append((reader.line_num, {k: (v if v != "" else None) for k, v in row.items() if k}))
+        _check_size(len(rows))
+    return rows
+
+def _check_size(count):
+    if count > MAX_BULK_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_ROWS} rows per request")
+
+def validate_rows(rows, schema):
+    valid, errors = [], []
+    for line, data in rows:
+        try:
+            valid.append(schema.model_validate(data))
+        except ValidationError as e:
+            errors.append({"line": line, "errors": e.errors(include_url=False, include_context=False)})
+    return valid, errors
+
+async def insert_rows(db: AsyncSession, model, rows):
+    """Вставляет провалидированные строки (dict с колонками таблицы) в рамках текущей транзакции сессии.
+
+    Партиции под даты строк заводит partitions.ensure до первого запроса сессии.
+    На asyncpg строки грузятся через COPY, на остальных драйверах - executemany.
+    Строки с уже встречавшимся idempotency_key пропускаются. Возвращает фактически
+    вставленные строки, чтобы агрегаты обновлялись только по ним.
+    """
+    table = model.__table__
+    columns = list(rows[0])
+    records = [tuple(row[c] for c in columns) for row in rows]
+    keyed = any(row.get("idempotency_key") for row in rows)
+    conn = await db.connection()
+
+    if conn.dialect.driver != "asyncpg":
+        stmt = insert(table)
+        if keyed:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["idempotency_key", "date"])
+        result = await db.execute(stmt.returning(*[table.c[c] for c in columns]), [dict(zip(columns, r)) for r in records])
+        return result.all()
+
+    # Адаптер asyncpg открывает транзакцию только с первым запросом через сессию, а COPY
+    # идёт мимо неё по "сырому" соединению: без этого запроса COPY зафиксировался бы сам,
+    # и сбой дальше (агрегаты) оставил бы строки без учёта в итогах
+    await db.execute(text("SELECT 1"))
+    driver = (await conn.get_raw_connection()).driver_connection
+    if not keyed:
+        try:
+            await driver.copy_records_to_table(table.name, records=records, columns=columns)
+        except Exception as e:
+            # Ошибки драйвера здесь не обёрнуты SQLAlchemy и мимо обработчика DBAPIError в main
+            if partitions.forget_if_missing(e):
+                raise HTTPException(status_code=503, detail=partitions.MISSING_DETAIL)
+            raise
+        Record = namedtuple("Record", columns)
+        return [Record(*r) for r in records]
+
+    # COPY не умеет ON CONFLICT: грузим во временную таблицу и переливаем с пропуском дублей
+    staging = f"staging_{table.name}"
+    await db.execute(text(
+        f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {', '.join(columns)} FROM {table.name} WITH NO DATA"
+    ))
+    await driver.copy_records_to_table(staging, records=records, columns=columns)
+    staged = sql_table(staging, *(column(c) for c in columns))
+    result = await db.execute(
+        insert(table)
+        .from_select(columns, select(*staged.c))
+        .on_conflict_do_nothing(index_elements=["idempotency_key", "date"])
+        .returning(*[table.c[c] for c in columns])
+    )
+    return result.all()
@@ -0,0 +1,94 @@
+import os
+from collections import defaultdict
+from typing import Dict, List
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+import models, database
+
+# Справочник категорий: название -> smallint id. Строки справочника не меняются и не
+# удаляются, поэтому соответствие кэшируется в процессе без инвалидации.
+# Ключ справочника - smallint (до 32767 названий на всех), поэтому число разных
+# категорий у одного пользователя ограничено MAX_USER_CATEGORIES.
+MAX_USER_CATEGORIES = int(os.getenv("MAX_USER_CATEGORIES", "50"))
+
+# SQLSTATE sequence_generator_limit_exceeded: identity справочника исчерпан
+SEQUENCE_LIMIT_EXCEEDED = "2200H"
+
+_ids: Dict[str, int] = {}
+
+async def ids(names) -> Dict[str, int]:
+    """Возвращает id для названий, заводя недостающие в справочнике.
+
+    Новые названия вставляются в отдельной транзакции: откат записи расхода
+    не должен оставить в кэше id, которого нет в базе.
+    """
+    missing = sorted(set(names) - _ids.keys())
+    if missing:
+        # Сначала читаем: вставка с ON CONFLICT расходует значение последовательности
+        # даже при конфликте, а smallint-ключей всего 32767
+        async with database.async_engine.begin() as conn:
+            query = select(models.Category.id, models.Category.name).where(models.Category.name.in_(missing))
+            _ids.update({r.name: r.id for r in await conn.execute(query)})
+            new = [name for name in missing if name not in _ids]
+            if new:
+                try:
+                    await conn.execute(
+                        insert(models.Category).on_conflict_do_nothing(index_elements=["name"]),
+                        [{"name": name} for name in new],
+                    )
+                except DBAPIError as e:
+                    if getattr(e.orig, "sqlstate", None) == SEQUENCE_LIMIT_EXCEEDED:
+                        raise HTTPException(status_code=422, detail="Category dictionary is full")
+                    raise
+                _ids.update({r.name: r.id for r in await conn.execute(query)})
+    return {name: _ids[name] for name in names}
+
+async def check_limits(rows: List[dict]):
+    """422, если у пользователя станет больше MAX_USER_CATEGORIES разных категорий.
+
+    Проверяется до записи в справочник, чтобы отклонённые названия не занимали его ключи.
+    Как и ids, идёт через своё соединение до первого запроса сессии: иначе запрос
+    держал бы два соединения пула сразу.
+    """
+    wanted = defaultdict(set)
+    for row in rows:
+        wanted[row["user_id"]].add(row["category"])
+    known = defaultdict(set)
+    async with database.async_engine.connect() as conn:
+        result = await conn.execute(
+            select(models.UserCategory.user_id, models.Category.name)
+            .join(models.Category, models.Category.id == models.UserCategory.category_id)
+            .where(models.UserCategory.user_id.in_(wanted))
+        )
+        for user_id, name in result:
+            known[user_id].add(name)
+    for user_id, names in wanted.items():
+        if len(known[user_id] | names) > MAX_USER_CATEGORIES:
+            raise HTTPException(
+                status_code=422,
+                detail=f"User {user_id} would have more than {MAX_USER_CATEGORIES} categories",
+            )
+
+async def assign(db: AsyncSession, rows: List[dict]) -> List[dict]:
+    """Заменяет category на category_id в строках расходов и отмечает категории за пользователями.
+
+    Связи пользователь-категория пишутся в транзакции сессии, вместе с самими расходами.
+    Вызывается до других запросов сессии: справочник читается через свои соединения.
+    """
+    await check_limits(rows)
+    mapping = await ids({row["category"] for row in rows})
+    for row in rows:
+        row["category_id"] = mapping[row.pop("category")]
+    links = sorted({(row["user_id"], row["category_id"]) for row in rows})
+    await db.execute(
+        insert(models.UserCategory).on_conflict_do_nothing(),
+        [{"user_id": user_id, "category_id": category_id} for user_id, category_id in links],
+    )
+    return rows
+
+def id_of(name: str):
+    # Для фильтров: подзапрос по уникальному индексу справочника
+    return select(models.Category.id).where(models.Category.name == name).scalar_subquery()
@@ -0,0 +1,66 @@
+from datetime import datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from sqlalchemy import select
+import models, database
+
+# Условные GET для эндпоинтов с user_id: ETag и Last-Modified строятся из версии
+# данных пользователя в user_totals, поэтому ответ 304 стоит один поиск по ключу
+# и не трогает агрегирующие запросы.
+
+async def validators(user_id: int):
+    """Возвращает (etag, last_modified, updated_at) для текущих данных пользователя."""
+    async with database.AsyncSessionLocal() as db:
+        row = (await db.execute(
+            select(models.UserTotals.version, models.UserTotals.updated_at)
+            .where(models.UserTotals.user_id == user_id)
+        )).first()
+    version, updated_at = row if row is not None else (0, None)
+
+    # Окна вроде "сегодня" и "последние 30 дней" сдвигаются в полночь и без новых записей,
+    # поэтому в валидатор входит и текущая дата
+    midnight = datetime.combine(datetime.now().date(), time.min).astimezone()
+    last_modified = max(updated_at, midnight) if updated_at is not None else midnight
+    stamp = int(updated_at.timestamp() * 1_000_000) if updated_at is not None else 0
+    etag = f'W/"{version}-{stamp}-{midnight.date().isoformat()}"'
+    return etag, last_modified.astimezone(timezone.utc), updated_at
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Слабое сравнение: префикс W/ не учитывается
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+async def middleware(request: Request, call_next):
+    user_id = request.query_params.get("user_id")
+    if request.method not in ("GET", "HEAD") or user_id is None or not user_id.lstrip("-").isdigit():
+        return await call_next(request)
+
+    etag, last_modified, updated_at = await validators(int(user_id))
+    # Время последней записи пользователя нужно для выбора реплики (main.get_read_db)
+    request.state.data_updated_at = updated_at
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    response = await call_next(request)
+    if response.status_code == 200:
+        response.headers.update(headers)
+    return response
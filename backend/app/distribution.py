@@ -0,0 +1,134 @@
+from typing import List
+import numpy as np
+from sqlalchemy import Float, Integer, SmallInteger, and_, column, func, or_, select, values
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+
+# Распределение сумм расходов по категориям для box/violin на дашборде.
+# Все проходы по строкам - агрегаты в SQL, в Python остаются только гистограммы
+# не больше MAX_KDE_BINS корзин на категорию, поэтому размер ответа не зависит от истории.
+
+MIN_KDE_BINS = 16
+MAX_KDE_BINS = 512
+MAX_OUTLIERS = 100  # на категорию, самые удалённые от усов
+
+def bandwidth(n: int, std: float, iqr: float, spread: float) -> float:
+    # Правило Сильвермана, как у plotly для violin
+    scale = min(std, iqr / 1.34) if iqr > 0 else std
+    if not scale:
+        return spread / 10 or 1.0
+    return 0.9 * scale * n ** -0.2
+
+def kde_bins(low: float, high: float, h: float) -> int:
+    # Корзина не шире половины полосы сглаживания, иначе пик размазывается
+    return int(np.clip(np.ceil((high - low) / (h / 2)), MIN_KDE_BINS, MAX_KDE_BINS))
+
+def kde(counts: np.ndarray, low: float, high: float, h: float):
+    """Гауссова KDE по гистограмме: центры корзин с весами вместо отдельных точек.
+
+    Сетка - центры корзин плюс 2h по краям; подряд идущие нули схлопываются
+    до концов серии, чтобы длинный пустой хвост не раздувал ответ.
+    """
+    width = (high - low) / len(counts)
+    centers = low + width * (np.arange(len(counts)) + 0.5)
+    pad = np.arange(1, int(np.ceil(2 * h / width)) + 1) * width
+    grid = np.concatenate([centers[0] - pad[::-1], centers, centers[-1] + pad])
+    z = (grid[:, None] - centers[None, :]) / h
+    density = (np.exp(-0.5 * z ** 2) * counts[None, :]).sum(axis=1) / (counts.sum() * h * np.sqrt(2 * np.pi))
+    density[density < density.max() * 1e-4] = 0
+    zero = density == 0
+    keep = ~(zero & np.r_[False, zero[:-1]] & np.r_[zero[1:], False])
+    return grid[keep], density[keep]
+
+async def category_distribution(db: AsyncSession, user_id: int, start_date=None) -> List[dict]:
+    expense = models.Expense
+    conditions = [expense.user_id == user_id]
+    if start_date is not None:
+        conditions.append(expense.date > start_date)
+
+    stats = (await db.execute(select(
+        expense.category_id,
+        models.Category.name.label('category'),
+        func.count().label('n'),
+        func.avg(expense.amount).label('mean'),
+        func.min(expense.amount).label('low'),
+        func.max(expense.amount).label('high'),
+        func.coalesce(func.stddev_samp(expense.amount), 0).label('std'),
+        func.percentile_cont(0.25).within_group(expense.amount).label('q1'),
+        func.percentile_cont(0.5).within_group(expense.amount).label('median'),
+        func.percentile_cont(0.75).within_group(expense.amount).label('q3'),
+    ).join(
+        models.Category, models.Category.id == expense.category_id
+    ).where(*conditions).group_by(expense.category_id, models.Category.id).order_by('category'))).all()
+    if not stats:
+        return []
+
+    # Границы усов (1.5 IQR) и гистограмма каждой категории - во второй запрос как VALUES
+    params = {}
+    for s in stats:
+        high = s.high if s.high > s.low else s.low + 1
+        h = bandwidth(s.n, float(s.std), float(s.q3 - s.q1), float(s.high - s.low))
+        params[s.category_id] = (float(s.low), float(high), h, kde_bins(s.low, high, h))
+    fences = values(
+        column('category_id', SmallInteger), column('lower', Float), column('upper', Float),
+        column('low', Float), column('high', Float), column('bins', Integer),
+        name='fences',
+    ).data([
+        (s.category_id, s.q1 - 1.5 * (s.q3 - s.q1), s.q3 + 1.5 * (s.q3 - s.q1), low, high, bins)
+        for s in stats
+        for low, high, _, bins in [params[s.category_id]]
+    ])
+    joined = and_(fences.c.category_id == expense.category_id, *conditions)
+    outside = or_(expense.amount < fences.c.lower, expense.amount > fences.c.upper)
+
+    bucket = func.least(func.width_bucket(expense.amount, fences.c.low, fences.c.high, fences.c.bins), fences.c.bins)
+    bins = (await db.execute(select(
+        expense.category_id,
+        bucket.label('bucket'),
+        func.count().label('n'),
+        func.min(expense.amount).filter(expense.amount >= fences.c.lower).label('lower_whisker'),
+        func.max(expense.amount).filter(expense.amount <= fences.c.upper).label('upper_whisker'),
+    ).select_from(expense).join(fences, joined).group_by(expense.category_id, bucket))).all()
+
+    distance = func.greatest(fences.c.lower - expense.amount, expense.amount - fences.c.upper)
+    ranked = select(
+        expense.category_id,
+        expense.amount,
+        func.row_number().over(partition_by=expense.category_id, order_by=distance.desc()).label('rank'),
+    ).select_from(expense).join(fences, joined).where(outside).subquery()
+    outliers = (await db.execute(
+        select(ranked.c.category_id, ranked.c.amount).where(ranked.c.rank <= MAX_OUTLIERS)
+    )).all()
+
+    counts = {s.category_id: np.zeros(params[s.category_id][3]) for s in stats}
+    lower_whiskers, upper_whiskers = {}, {}
+    for b in bins:
+        counts[b.category_id][b.bucket - 1] += b.n
+        if b.lower_whisker is not None:
+            lower_whiskers[b.category_id] = min(lower_whiskers.get(b.category_id, b.lower_whisker), b.lower_whisker)
+        if b.upper_whisker is not None:
+            upper_whiskers[b.category_id] = max(upper_whiskers.get(b.category_id, b.upper_whisker), b.upper_whisker)
+    outlier_values = {s.category_id: [] for s in stats}
+    for o in outliers:
+        outlier_values[o.category_id].append(float(o.amount))
+
+    result = []
+    for s in stats:
+        low, high, h, _ = params[s.category_id]
+        grid, density = kde(counts[s.category_id], low, high, h)
+        result.append({
+            "category": s.category,
+            "count": int(s.n),
+            "mean": float(s.mean),
+            "min": float(s.low),
+            "max": float(s.high),
+            "q1": float(s.q1),
+            "median": float(s.median),
+            "q3": float(s.q3),
+            "lower_whisker": float(lower_whiskers.get(s.category_id, s.low)),
+            "upper_whisker": float(upper_whiskers.get(s.category_id, s.high)),
+            "outliers": sorted(outlier_values[s.category_id]),
+            "kde_x": grid.round(2).tolist(),
+            "kde_y": density.tolist(),
+        })
+    return result
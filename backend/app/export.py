@@ -0,0 +1,108 @@
+from typing import Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import BigInteger, Date, DateTime, Float, Integer, select
+import replica
+
+# Выгрузка сырых строк в колоночных форматах для аналитики (pandas, ноутбуки):
+# Arrow IPC stream читается в DataFrame почти без разбора, Parquet - для файлов.
+# Проекция колонок и фильтры уходят в SQL, ответ пишется пачками по мере чтения курсора.
+
+EXPORT_BATCH_SIZE = 10_000
+
+FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Служебные колонки не выгружаются; вместо id категории - её название
+HIDDEN_COLUMNS = {"idempotency_key"}
+REPLACED_COLUMNS = {"category_id": "category"}
+
+def arrow_type(column):
+    if isinstance(column.type, BigInteger):
+        return pa.int64()
+    if isinstance(column.type, Integer):
+        return pa.int32()
+    if isinstance(column.type, Float):
+        return pa.float64()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us", tz="UTC")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    return pa.string()
+
+class ChunkSink:
+    """Файлоподобный приёмник для писателей pyarrow: накапливает байты до следующей отдачи клиенту."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_response(model, user_id: int, columns: Optional[str], fmt: str,
+                    start_date=None, end_date=None, use_replica=False, **filters) -> StreamingResponse:
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {fmt}")
+    keys = [REPLACED_COLUMNS.get(c.name, c.name) for c in model.__table__.columns if c.name not in HIDDEN_COLUMNS]
+    available = {key: getattr(model, key).expression.label(key) for key in keys}
+    names = [name.strip() for name in columns.split(",") if name.strip()] if columns else list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+
+    selected = [available[name] for name in names]
+    schema = pa.schema([pa.field(c.name, arrow_type(c)) for c in selected])
+    query = select(*selected).where(model.user_id == user_id)
+    if start_date:
+        query = query.where(model.date >= start_date)
+    if end_date:
+        query = query.where(model.date <= end_date)
+    for name, value in filters.items():
+        if value is not None:
+            query = query.where(getattr(model, name) == value)
+    query = query.order_by(model.date, model.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+    async def body():
+        sink = ChunkSink()
+        writer = pa.ipc.new_stream(sink, schema) if fmt == "arrow" else pq.ParquetWriter(sink, schema)
+        async with replica.session(use_replica) as db:
+            result = await db.stream(query)
+            async for rows in result.partitions():
+                batch = pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)],
+                    schema=schema,
+                )
+                if fmt == "arrow":
+                    writer.write_batch(batch)
+                else:
+                    writer.write_table(pa.Table.from_batches([batch]))
+                if sink.chunks:
+                    yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    filename = f"{model.__tablename__}_{user_id}.{fmt}"
+    return StreamingResponse(body(), media_type=FORMATS[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -1,14 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException
+import base64
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from datetime import datetime, timedelta
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, extract, literal_column, or_, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import date, datetime, timedelta
 from typing import List, Optional
-import models, schemas, database
+import models, schemas, database, rollups, bulk, migrations, summary, conditional, distribution, export, categories, partitions, replica, metrics
 
-models.Base.metadata.create_all(bind=database.engine)
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
 
-app = FastAPI(title="Finance Tracker API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await migrations.upgrade(conn, online=True)
+        await partitions.create_ahead(conn)
+    yield
+    await database.async_engine.dispose()
+    if database.replica_engine is not None:
+        await database.replica_engine.dispose()
+
+app = FastAPI(title="Finance Tracker API", lifespan=lifespan)
+
+# Подключается раньше CORS, чтобы ответы 304 тоже получали CORS-заголовки
+app.middleware("http")(conditional.middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,134 +36,425 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
-def get_db():
-    db = database.SessionLocal()
-    try:
+# Снаружи всех остальных: в длительность входят и условные проверки, и CORS
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.instrument(database.async_engine, "primary")
+if database.replica_engine is not None:
+    metrics.instrument(database.replica_engine, "replica")
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return metrics.metrics_response()
+
+@app.exception_handler(DBAPIError)
+async def database_error(request: Request, exc: DBAPIError):
+    # Партицию месяца архивировал maintain из другого процесса: повтор заведёт её заново
+    if partitions.forget_if_missing(exc):
+        return JSONResponse(status_code=503, content={"detail": partitions.MISSING_DETAIL})
+    raise exc
+
+async def get_db():
+    async with database.AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def read_replica(request: Request) -> bool:
+    # Время последней записи пользователя кладёт conditional.middleware; без user_id его нет
+    return await replica.usable(getattr(request.state, "data_updated_at", None))
+
+async def get_read_db(use_replica: bool = Depends(read_replica)):
+    # Сессия только для чтения: SELECT уходят в реплику, если она годится для этого запроса
+    async with replica.session(use_replica) as db:
+        yield db
+
+def window_start(days: int) -> date:
+    # Окно "последние N дней": даты строго после (сегодня - N)
+    return datetime.now().date() - timedelta(days=days)
+
+async def insert_once(db: AsyncSession, model, data: dict):
+    """Вставляет строку; повтор с тем же idempotency_key возвращает уже сохранённую.
+
+    Возвращает (строка, True если вставлена сейчас). Партицию под дату заводит эндпоинт
+    заранее (partitions.ensure).
+    """
+    stmt = pg_insert(model).values(**data).on_conflict_do_nothing(
+        index_elements=["idempotency_key", "date"]
+    ).returning(model.id)
+    row_id = (await db.execute(stmt)).scalar_one_or_none()
+    # Строку перечитываем: вычисляемые колонки (название категории) не попадают в RETURNING.
+    # Условие на date оставляет в плане одну партицию - по одному id их пришлось бы обойти все
+    if row_id is not None:
+        return (await db.execute(select(model).where(model.id == row_id, model.date == data["date"]))).scalar_one(), True
+    existing = await db.execute(select(model).where(
+        model.idempotency_key == data["idempotency_key"],
+        model.date == data["date"]
+    ))
+    return existing.scalar_one(), False
 
 @app.post("/expenses/", response_model=schemas.Expense)
-def create_expense(expense: schemas.ExpenseCreate, db: Session = Depends(get_db)):
-    db_expense = models.Expense(**expense.dict())
-    db.add(db_expense)
-    db.commit()
-    db.refresh(db_expense)
+async def create_expense(expense: schemas.ExpenseCreate, db: AsyncSession = Depends(get_db)):
+    await partitions.ensure(models.Expense, [expense.date])
+    [data] = await categories.assign(db, [expense.model_dump()])
+    db_expense, created = await insert_once(db, models.Expense, data)
+    if created:
+        await rollups.apply_expense(db, db_expense)
+    await db.commit()
     return db_expense
 
+@app.post("/expenses/bulk/", response_model=schemas.BulkResult)
+async def create_expenses_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    # JSON-массив или CSV; валидные строки вставляются пачками в одной транзакции,
+    # невалидные возвращаются с ошибками по номеру строки
+    expenses, errors = bulk.validate_rows(await bulk.read_rows(request), schemas.ExpenseCreate)
+    inserted = []
+    if expenses:
+        await partitions.ensure(models.Expense, {e.date for e in expenses})
+        rows = await categories.assign(db, [e.model_dump() for e in expenses])
+        inserted = await bulk.insert_rows(db, models.Expense, rows)
+        await rollups.apply_expenses(db, inserted)
+        await db.commit()
+    return {"inserted": len(inserted), "duplicates": len(expenses) - len(inserted), "errors": errors}
+
+def expenses_query(user_id: int, start_date=None, end_date=None, category=None):
+    query = select(models.Expense).where(models.Expense.user_id == user_id)
+    
+    if start_date:
+        query = query.where(models.Expense.date >= start_date)
+    if end_date:
+        query = query.where(models.Expense.date <= end_date)
+    if category:
+        query = query.where(models.Expense.category_id == categories.id_of(category))
+    
+    return query.order_by(models.Expense.date.desc(), models.Expense.id.desc())
+
+def encode_cursor(expense: models.Expense) -> str:
+    raw = f"{expense.date.isoformat()}:{expense.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        day, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return date.fromisoformat(day), int(expense_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @app.get("/expenses/", response_model=List[schemas.Expense])
-def get_expenses(
+async def get_expenses(
+    response: Response,
     user_id: int,
-    start_date: Optional[str] = None,
-    end_date: Optional[str] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    query = db.query(models.Expense).filter(models.Expense.user_id == user_id)
+    # Keyset-пагинация по (date, id): курсор следующей страницы - в заголовке X-Next-Cursor
+    query = expenses_query(user_id, start_date, end_date, category)
+    if cursor:
+        query = query.where(tuple_(models.Expense.date, models.Expense.id) < tuple_(*decode_cursor(cursor)))
+    if limit:
+        query = query.limit(limit)
     
-    if start_date:
-        query = query.filter(models.Expense.date >= start_date)
-    if end_date:
-        query = query.filter(models.Expense.date <= end_date)
-    if category:
-        query = query.filter(models.Expense.category == category)
+    expenses = (await db.execute(query)).scalars().all()
+    if limit and len(expenses) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(expenses[-1])
+    return expenses
+
+@app.get("/expenses/stream/")
+async def stream_expenses(
+    user_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category: Optional[str] = None,
+    use_replica: bool = Depends(read_replica)
+):
+    # NDJSON из серверного курсора: память не зависит от размера истории.
+    # Сессия открывается внутри генератора, т.к. зависимости закрываются до отправки тела.
+    query = expenses_query(user_id, start_date, end_date, category).execution_options(yield_per=STREAM_BATCH_SIZE)
+    
+    async def rows():
+        async with replica.session(use_replica) as db:
+            result = await db.stream(query)
+            async for expense in result.scalars():
+                yield schemas.Expense.model_validate(expense).model_dump_json() + "\n"
     
-    return query.order_by(models.Expense.date.desc()).all()
+    return StreamingResponse(rows(), media_type="application/x-ndjson")
 
-@app.get("/stats/by-category/")
-def get_stats_by_category(user_id: int, days: int = 30, db: Session = Depends(get_db)):
-    start_date = datetime.now() - timedelta(days=days)
-    result = db.query(
-        models.Expense.category,
-        func.sum(models.Expense.amount).label('total'),
-        func.count(models.Expense.id).label('count')
-    ).filter(
+# Строку видно в ленте изменений, только когда записавшая её транзакция старше самой старой
+# ещё идущей: всё, что зафиксируется позже, получит курсор больше уже выданных
+CHANGE_COMMITTED = text("expenses.xact_id < pg_snapshot_xmin(pg_current_snapshot())")
+
+def decode_change_cursor(cursor: str):
+    try:
+        xact_id, expense_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return int(xact_id), int(expense_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/expenses/changes/", response_model=List[schemas.Expense])
+async def get_expense_changes(
+    response: Response,
+    user_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Курсор по id пропускал бы строки: id выдаётся до коммита, и строка с меньшим id может
+    # зафиксироваться после того, как клиент уже получил большие. Поэтому порядок - по
+    # (xact_id записавшей транзакции, id). Курсор следующего запроса - в X-Next-Cursor;
+    # полная страница означает, что за ней могут быть ещё строки.
+    query = select(models.Expense, literal_column("expenses.xact_id::text").label("xact_id")).where(
         models.Expense.user_id == user_id,
-        models.Expense.date >= start_date
-    ).group_by(models.Expense.category).all()
+        CHANGE_COMMITTED,
+    )
+    if cursor:
+        xact_id, expense_id = decode_change_cursor(cursor)
+        query = query.where(text(
+            "(expenses.xact_id, expenses.id) > (CAST(CAST(:xact_id AS text) AS xid8), :expense_id)"
+        ).bindparams(xact_id=str(xact_id), expense_id=expense_id))
+    query = query.order_by(literal_column("expenses.xact_id"), models.Expense.id).limit(limit)
+    rows = (await db.execute(query)).all()
+    if rows:
+        last, xact_id = rows[-1]
+        cursor = base64.urlsafe_b64encode(f"{xact_id}:{last.id}".encode()).decode()
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    return [expense for expense, _ in rows]
+
+@app.get("/export/expenses/")
+async def export_expenses(
+    user_id: int,
+    columns: Optional[str] = None,
+    format: str = "arrow",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    category: Optional[str] = None,
+    use_replica: bool = Depends(read_replica)
+):
+    # columns - через запятую, например columns=date,category,amount
+    category_id = categories.id_of(category) if category else None
+    return export.export_response(models.Expense, user_id, columns, format, start_date, end_date,
+                                  use_replica=use_replica, category_id=category_id)
+
+@app.get("/stats/by-category/")
+async def get_stats_by_category(user_id: int, days: int = 30, db: AsyncSession = Depends(get_read_db)):
+    # Группировка по smallint id, названия - из справочника уже после агрегации
+    start_date = window_start(days)
+    totals = select(
+        models.ExpenseDailyRollup.category_id,
+        func.sum(models.ExpenseDailyRollup.total).label('total'),
+        func.sum(models.ExpenseDailyRollup.count).label('count')
+    ).where(
+        models.ExpenseDailyRollup.user_id == user_id,
+        models.ExpenseDailyRollup.day > start_date
+    ).group_by(models.ExpenseDailyRollup.category_id).subquery()
+    result = (await db.execute(
+        select(models.Category.name.label('category'), totals.c.total, totals.c.count)
+        .join(totals, totals.c.category_id == models.Category.id)
+    )).all()
     
-    return [{"category": r.category, "total": float(r.total), "count": r.count} for r in result]
+    return [{"category": r.category, "total": float(r.total), "count": int(r.count)} for r in result]
 
 @app.get("/stats/daily/")
-def get_daily_stats(user_id: int, days: int = 30, db: Session = Depends(get_db)):
-    start_date = datetime.now() - timedelta(days=days)
-    result = db.query(
-        models.Expense.date,
-        func.sum(models.Expense.amount).label('total')
-    ).filter(
-        models.Expense.user_id == user_id,
-        models.Expense.date >= start_date
-    ).group_by(models.Expense.date).order_by(models.Expense.date).all()
+async def get_daily_stats(user_id: int, days: int = 30, db: AsyncSession = Depends(get_read_db)):
+    start_date = window_start(days)
+    result = (await db.execute(select(
+        models.ExpenseDailyRollup.day.label('date'),
+        func.sum(models.ExpenseDailyRollup.total).label('total')
+    ).where(
+        models.ExpenseDailyRollup.user_id == user_id,
+        models.ExpenseDailyRollup.day > start_date
+    ).group_by(models.ExpenseDailyRollup.day).order_by(models.ExpenseDailyRollup.day))).all()
     
     return [{"date": str(r.date), "total": float(r.total)} for r in result]
 
 @app.get("/stats/monthly/")
-def get_monthly_stats(user_id: int, db: Session = Depends(get_db)):
-    result = db.query(
-        extract('year', models.Expense.date).label('year'),
-        extract('month', models.Expense.date).label('month'),
-        func.sum(models.Expense.amount).label('total')
-    ).filter(
-        models.Expense.user_id == user_id
-    ).group_by('year', 'month').order_by('year', 'month').all()
+async def get_monthly_stats(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    result = (await db.execute(select(
+        extract('year', models.ExpenseDailyRollup.day).label('year'),
+        extract('month', models.ExpenseDailyRollup.day).label('month'),
+        func.sum(models.ExpenseDailyRollup.total).label('total')
+    ).where(
+        models.ExpenseDailyRollup.user_id == user_id
+    ).group_by('year', 'month').order_by('year', 'month'))).all()
     
     return [{"year": int(r.year), "month": int(r.month), "total": float(r.total)} for r in result]
 
+@app.get("/stats/month-category/")
+async def get_month_category_stats(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    rollup = models.ExpenseDailyRollup
+    month = func.to_char(rollup.day, 'YYYY-MM')
+    result = (await db.execute(select(
+        month.label('month'),
+        models.Category.name.label('category'),
+        func.sum(rollup.total).label('total')
+    ).join(
+        models.Category, models.Category.id == rollup.category_id
+    ).where(
+        rollup.user_id == user_id
+    ).group_by('month', models.Category.id).order_by('month', 'category'))).all()
+    
+    return [{"month": r.month, "category": r.category, "total": float(r.total)} for r in result]
+
+@app.get("/stats/week-weekday/")
+async def get_week_weekday_stats(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    # ISO-неделя вместе с ISO-годом, чтобы недели разных лет не складывались; день недели 0 - понедельник
+    rollup = models.ExpenseDailyRollup
+    week = func.to_char(rollup.day, 'IYYY-"W"IW')
+    weekday = extract('isodow', rollup.day) - 1
+    result = (await db.execute(select(
+        week.label('week'),
+        weekday.label('weekday'),
+        func.sum(rollup.total).label('total')
+    ).where(
+        rollup.user_id == user_id
+    ).group_by('week', 'weekday').order_by('week', 'weekday'))).all()
+    
+    return [{"week": r.week, "weekday": int(r.weekday), "total": float(r.total)} for r in result]
+
+@app.get("/stats/distribution/", response_model=List[schemas.CategoryDistribution])
+async def get_distribution(user_id: int, days: Optional[int] = None, db: AsyncSession = Depends(get_read_db)):
+    # Квартили, усы, выбросы и KDE по категориям - для box/violin без выгрузки сырых строк
+    start_date = window_start(days) if days else None
+    return await distribution.category_distribution(db, user_id, start_date)
+
 @app.get("/stats/summary/")
-def get_summary(user_id: int, db: Session = Depends(get_db)):
-    today = datetime.now().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
+async def get_summary(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    windows = await summary.compute(db, user_id, summary.parse_windows(["today", "week", "month"]))
+    return {w["name"]: w["expenses"] for w in windows}
+
+@app.get("/stats/windows/", response_model=List[schemas.WindowSummary])
+async def get_windows(
+    user_id: int,
+    windows: List[str] = Query(summary.DEFAULT_WINDOWS),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Доходы, расходы и остаток за произвольный набор окон одним запросом
+    return await summary.compute(db, user_id, summary.parse_windows(windows))
+
+@app.get("/dashboard/", response_model=schemas.DashboardBundle)
+async def get_dashboard(
+    user_id: int,
+    days: int = 30,
+    include_expenses: bool = True,
+    windows: List[str] = Query(summary.DEFAULT_WINDOWS),
+    db: AsyncSession = Depends(get_read_db)
+):
+    # Графики - одним проходом по rollup-таблице через GROUPING SETS:
+    # (day) - дневная динамика, (category) - по категориям, (year, month) - по месяцам.
+    # Итоги и баланс - одним запросом по окнам.
+    rollup = models.ExpenseDailyRollup
+    start_date = window_start(days)
+    in_window = rollup.day > start_date
+    year = extract('year', rollup.day)
+    month = extract('month', rollup.day)
     
-    today_total = db.query(func.sum(models.Expense.amount)).filter(
-        models.Expense.user_id == user_id,
-        models.Expense.date == today
-    ).scalar() or 0
+    grouped = select(
+        func.grouping(rollup.day).label('no_day'),
+        func.grouping(rollup.category_id).label('no_category'),
+        rollup.day,
+        rollup.category_id,
+        year.label('year'),
+        month.label('month'),
+        func.sum(rollup.total).label('total'),
+        func.sum(rollup.total).filter(in_window).label('window_total'),
+        func.sum(rollup.count).filter(in_window).label('window_count'),
+    ).where(
+        rollup.user_id == user_id
+    ).group_by(
+        func.grouping_sets(tuple_(rollup.day), tuple_(rollup.category_id), tuple_(year, month))
+    ).having(
+        or_(func.grouping(rollup.day) == 1, rollup.day > start_date)
+    ).having(
+        or_(func.grouping(rollup.category_id) == 1, func.sum(rollup.count).filter(in_window) > 0)
+    ).subquery()
+    rows = (await db.execute(
+        select(grouped, models.Category.name.label('category'))
+        .outerjoin(models.Category, models.Category.id == grouped.c.category_id)
+    )).all()
     
-    week_total = db.query(func.sum(models.Expense.amount)).filter(
-        models.Expense.user_id == user_id,
-        models.Expense.date >= week_ago
-    ).scalar() or 0
+    by_category, daily, monthly = [], [], []
+    for r in rows:
+        if not r.no_day:
+            daily.append({"date": str(r.day), "total": float(r.window_total)})
+        elif not r.no_category:
+            by_category.append({"category": r.category, "total": float(r.window_total), "count": int(r.window_count)})
+        else:
+            monthly.append({"year": int(r.year), "month": int(r.month), "total": float(r.total)})
+    daily.sort(key=lambda d: d["date"])
+    monthly.sort(key=lambda m: (m["year"], m["month"]))
     
-    month_total = db.query(func.sum(models.Expense.amount)).filter(
-        models.Expense.user_id == user_id,
-        models.Expense.date >= month_ago
-    ).scalar() or 0
+    # Окна для карточек дашборда считаем всегда, запрошенные - вдобавок к ним
+    specs = list(dict.fromkeys(["today", "week", "month", "all", *windows]))
+    totals = {w["name"]: w for w in await summary.compute(db, user_id, summary.parse_windows(specs))}
+    
+    expenses = None
+    if include_expenses:
+        expenses = (await db.execute(expenses_query(user_id))).scalars().all()
     
     return {
-        "today": float(today_total),
-        "week": float(week_total),
-        "month": float(month_total)
+        "summary": {name: totals[name]["expenses"] for name in ("today", "week", "month")},
+        "balance": {key: totals["all"][key] for key in ("income", "expenses", "balance")},
+        "windows": list(totals.values()),
+        "by_category": by_category,
+        "daily": daily,
+        "monthly": monthly,
+        "expenses": expenses
     }
 
 @app.get("/categories/")
-def get_categories(db: Session = Depends(get_db)):
-    result = db.query(models.Expense.category).distinct().all()
-    return [r.category for r in result]
+async def get_categories(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    # Только категории самого пользователя - по индексу user_categories
+    query = select(models.Category.name).join(
+        models.UserCategory, models.UserCategory.category_id == models.Category.id
+    ).where(models.UserCategory.user_id == user_id).order_by(models.Category.name)
+    return (await db.execute(query)).scalars().all()
 
 @app.post("/income/", response_model=schemas.Income)
-def create_income(income: schemas.IncomeCreate, db: Session = Depends(get_db)):
-    db_income = models.Income(**income.dict())
-    db.add(db_income)
-    db.commit()
-    db.refresh(db_income)
+async def create_income(income: schemas.IncomeCreate, db: AsyncSession = Depends(get_db)):
+    await partitions.ensure(models.Income, [income.date])
+    db_income, created = await insert_once(db, models.Income, income.model_dump())
+    if created:
+        await rollups.apply_income(db, db_income)
+    await db.commit()
     return db_income
 
+@app.post("/income/bulk/", response_model=schemas.BulkResult)
+async def create_income_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    incomes, errors = bulk.validate_rows(await bulk.read_rows(request), schemas.IncomeCreate)
+    inserted = []
+    if incomes:
+        await partitions.ensure(models.Income, {i.date for i in incomes})
+        inserted = await bulk.insert_rows(db, models.Income, [i.model_dump() for i in incomes])
+        await rollups.apply_incomes(db, inserted)
+        await db.commit()
+    return {"inserted": len(inserted), "duplicates": len(incomes) - len(inserted), "errors": errors}
+
+@app.get("/export/income/")
+async def export_income(
+    user_id: int,
+    columns: Optional[str] = None,
+    format: str = "arrow",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    source: Optional[str] = None,
+    use_replica: bool = Depends(read_replica)
+):
+    return export.export_response(models.Income, user_id, columns, format, start_date, end_date,
+                                  use_replica=use_replica, source=source)
+
 @app.get("/balance/")
-def get_balance(user_id: int, db: Session = Depends(get_db)):
-    total_income = db.query(func.sum(models.Income.amount)).filter(
-        models.Income.user_id == user_id
-    ).scalar() or 0
-    
-    total_expenses = db.query(func.sum(models.Expense.amount)).filter(
-        models.Expense.user_id == user_id
-    ).scalar() or 0
+async def get_balance(user_id: int, db: AsyncSession = Depends(get_read_db)):
+    totals = await db.get(models.UserTotals, user_id)
+    total_income = totals.income_total if totals else 0
+    total_expenses = totals.expense_total if totals else 0
     
     return {
         "income": float(total_income),
         "expenses": float(total_expenses),
         "balance": float(total_income - total_expenses)
     }
-
@@ -0,0 +1,157 @@
+import logging
+import os
+import re
+import time
+from contextvars import ContextVar
+from fastapi import Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, Summary, generate_latest
+from sqlalchemy import event
+from starlette.routing import Match
+
+logger = logging.getLogger(__name__)
+
+# Метрики Prometheus для /metrics: HTTP-запросы по шаблону маршрута, SQL-запросы
+# (перехват через события движка) и пул соединений. Запросы дольше SLOW_QUERY_SECONDS
+# пишутся в лог вместе с маршрутом, который их выполнил.
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))  # 0 - не логировать
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter("http_requests_total", "HTTP requests", ["method", "route", "status"])
+REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request duration including body streaming",
+                            ["method", "route"], buckets=LATENCY_BUCKETS)
+IN_PROGRESS = Gauge("http_requests_in_progress", "HTTP requests in progress", ["method", "route"])
+RESPONSE_BYTES = Summary("http_response_size_bytes", "HTTP response body size", ["method", "route"])
+
+QUERIES = Counter("db_queries_total", "SQL statements executed", ["engine", "route", "statement"])
+QUERY_SECONDS = Histogram("db_query_duration_seconds", "SQL statement duration",
+                          ["engine", "route", "statement"], buckets=LATENCY_BUCKETS)
+QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised", ["engine", "route", "statement"])
+POOL_WAIT_SECONDS = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection",
+                              ["engine"], buckets=LATENCY_BUCKETS)
+POOL_CONNECTIONS = Gauge("db_pool_connections", "Pool connections by state", ["engine", "state"])
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size (without overflow)", ["engine"])
+
+# Шаблон маршрута текущего HTTP-запроса: SQL-метрики и лог медленных запросов знают,
+# какой эндпоинт их выполнил. Фоновая работа вне запроса помечается "-".
+current_route: ContextVar[str] = ContextVar("current_route", default="-")
+
+def route_template(request: Request) -> str:
+    # Путь с подставленными параметрами дал бы по ряду на каждый id - берём шаблон маршрута
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+class MetricsMiddleware:
+    """ASGI-middleware HTTP-метрик.
+
+    Тело отдаётся уже после возврата из эндпоинта (потоковые выгрузки - долго), поэтому
+    длительность и размер фиксируются по окончании отправки. Учёт идёт в finally вокруг
+    всего запроса: и при ошибке, и при обрыве соединения до начала тела.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        route = route_template(request)
+        labels = (request.method, route)
+        token = current_route.set(f"{request.method} {route}")
+        IN_PROGRESS.labels(*labels).inc()
+        started = time.perf_counter()
+        status, size = 500, 0
+
+        async def counted_send(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counted_send)
+        finally:
+            current_route.reset(token)
+            IN_PROGRESS.labels(*labels).dec()
+            REQUESTS.labels(*labels, str(status)).inc()
+            REQUEST_SECONDS.labels(*labels).observe(time.perf_counter() - started)
+            RESPONSE_BYTES.labels(*labels).observe(size)
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+_STATEMENT = re.compile(r"^\s*(\w+)")
+_TABLE = re.compile(r"[()]|\b(?:FROM|INTO|UPDATE|JOIN)\s+\"?(\w+)", re.IGNORECASE)
+
+def statement_label(statement: str) -> str:
+    """Короткая метка SQL: операция и основная таблица ("SELECT expense_daily_rollup").
+
+    Текст запроса целиком дал бы неограниченное число рядов (IN-списки разной длины и т.п.).
+    Таблица - первая вне скобок, чтобы подзапрос в списке колонок её не подменял.
+    """
+    operation = _STATEMENT.match(statement)
+    label = operation[1].upper() if operation else "OTHER"
+    depth, tables = 0, []
+    for match in _TABLE.finditer(statement):
+        if match[0] == "(":
+            depth += 1
+        elif match[0] == ")":
+            depth -= 1
+        else:
+            tables.append((depth, match[1]))
+    table = next((name for level, name in tables if level == 0), tables[0][1] if tables else None)
+    return f"{label} {table}" if table else label
+
+def instrument(engine, name: str):
+    """Подключает SQL- и пул-метрики к асинхронному движку; name - метка engine (primary/replica)."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        route = current_route.get()
+        labels = (name, route, statement_label(statement))
+        QUERIES.labels(*labels).inc()
+        QUERY_SECONDS.labels(*labels).observe(elapsed)
+        if SLOW_QUERY_SECONDS and elapsed >= SLOW_QUERY_SECONDS:
+            logger.warning(f"Slow query {elapsed:.3f} s on {name} [{route}]: {' '.join(statement.split())}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        QUERY_ERRORS.labels(name, current_route.get(), statement_label(context.statement or "")).inc()
+
+    pool = sync_engine.pool
+    if hasattr(pool, "checkedout"):
+        # Загрузка пула снимается в момент запроса /metrics
+        POOL_SIZE.labels(name).set_function(lambda: sync_engine.pool.size())
+        POOL_CONNECTIONS.labels(name, "checked_out").set_function(lambda: sync_engine.pool.checkedout())
+        POOL_CONNECTIONS.labels(name, "idle").set_function(lambda: sync_engine.pool.checkedin())
+        POOL_CONNECTIONS.labels(name, "overflow").set_function(lambda: max(sync_engine.pool.overflow(), 0))
+
+        # Ожидание свободного соединения (или открытие нового) происходит в _do_get пула:
+        # события "начал ждать" у пула нет, поэтому время меряется обёрткой вокруг него
+        do_get = pool._do_get
+
+        def timed_do_get():
+            started = time.perf_counter()
+            try:
+                return do_get()
+            finally:
+                POOL_WAIT_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+        pool._do_get = timed_do_get
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.orm import Session
+import database, models, partitions, rollups
+
+# Изменения схемы для уже существующих баз: create_all создаёт только недостающие
+# таблицы, но не добавляет колонки и индексы в существующие. Миграции нумеруются,
+# применённые записываются в schema_migrations. Каждая миграция написана так, чтобы
+# её можно было выполнить и на свежей базе, созданной create_all или init.sql,
+# и на базе, где изменения уже сделаны до появления нумерации.
+
+# Ключ advisory-блокировки: несколько процессов бэкенда не мигрируют одновременно
+LOCK_KEY = 7_340_201
+
+# Миграции, которые читают или переписывают expenses/income целиком и держат блокировку
+# таблиц всё это время. При старте бэкенда они применяются только на пустой базе,
+# на базе с данными - отдельным шагом при остановленном API: python migrations.py upgrade
+OFFLINE = {3, 5, 6, 7, 8}
+
+def backfill_rollups(conn):
+    # Агрегаты появились позже данных: без пересчёта статистика и баланс были бы нулевыми.
+    # Если итоги уже ведутся, не трогаем их: rebuild не учёл бы архивные партиции
+    if conn.execute(text("SELECT EXISTS (SELECT 1 FROM user_totals)")).scalar():
+        return
+    with Session(bind=conn) as db:
+        rollups.rebuild(db)
+
+MIGRATIONS = [
+    (1, "idempotency keys", [
+        "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)",
+        # С date: на секционированной таблице уникальный индекс должен включать ключ секционирования
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_expenses_idempotency_key ON expenses(idempotency_key, date)",
+        "ALTER TABLE income ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_income_idempotency_key ON income(idempotency_key, date)",
+    ]),
+    (2, "user data version", [
+        "ALTER TABLE user_totals ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL DEFAULT 1",
+        "ALTER TABLE user_totals ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    ]),
+    # Текстовая категория в строках расходов -> smallint-ссылка на справочник categories
+    (3, "categories dictionary", [
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'expenses' AND column_name = 'category') THEN
+            INSERT INTO categories (name)
+                SELECT DISTINCT category FROM expenses ORDER BY category
+                ON CONFLICT (name) DO NOTHING;
+            ALTER TABLE expenses ADD COLUMN IF NOT EXISTS category_id SMALLINT REFERENCES categories(id);
+            UPDATE expenses SET category_id = categories.id
+                FROM categories WHERE categories.name = expenses.category;
+            ALTER TABLE expenses ALTER COLUMN category_id SET NOT NULL;
+            ALTER TABLE expenses DROP COLUMN category;
+            INSERT INTO user_categories (user_id, category_id)
+                SELECT DISTINCT user_id, category_id FROM expenses
+                ON CONFLICT DO NOTHING;
+        END IF;
+    END $$
+    """,
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'expense_daily_rollup' AND column_name = 'category') THEN
+            ALTER TABLE expense_daily_rollup ADD COLUMN category_id SMALLINT REFERENCES categories(id);
+            UPDATE expense_daily_rollup SET category_id = categories.id
+                FROM categories WHERE categories.name = expense_daily_rollup.category;
+            ALTER TABLE expense_daily_rollup DROP CONSTRAINT expense_daily_rollup_pkey;
+            ALTER TABLE expense_daily_rollup DROP COLUMN category;
+            ALTER TABLE expense_daily_rollup ADD PRIMARY KEY (user_id, day, category_id);
+        END IF;
+    END $$
+    """,
+    ]),
+    (4, "month partition helper", [
+    # Создаёт партицию parent_YYYY_MM за месяц, в который попадает month
+    """
+    CREATE OR REPLACE FUNCTION create_month_partition(parent TEXT, month DATE) RETURNS VOID AS $$
+    DECLARE
+        month_start DATE := date_trunc('month', month)::date;
+        partition TEXT := parent || to_char(month_start, '_YYYY_MM');
+    BEGIN
+        PERFORM pg_advisory_xact_lock(hashtext(partition));
+        EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                       partition, parent, month_start, (month_start + INTERVAL '1 month')::date);
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    ]),
+    # Обычные таблицы expenses/income -> секционированные по месяцам. Данные переливаются
+    # в новую таблицу, последовательность id сохраняется.
+    (5, "monthly partitions", [
+    """
+    DO $$
+    DECLARE
+        parent TEXT;
+        month DATE;
+    BEGIN
+        FOREACH parent IN ARRAY ARRAY['expenses', 'income'] LOOP
+            IF (SELECT relkind FROM pg_class WHERE oid = parent::regclass) = 'r' THEN
+                EXECUTE format('ALTER TABLE %I RENAME TO %I', parent, parent || '_unpartitioned');
+                EXECUTE format('ALTER TABLE %I RENAME CONSTRAINT %I TO %I',
+                               parent || '_unpartitioned', parent || '_pkey', parent || '_unpartitioned_pkey');
+                EXECUTE format('ALTER SEQUENCE %I OWNED BY NONE', parent || '_id_seq');
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS) PARTITION BY RANGE (date)',
+                               parent, parent || '_unpartitioned');
+                EXECUTE format('ALTER TABLE %I ADD PRIMARY KEY (id, date)', parent);
+                FOR month IN EXECUTE format('SELECT DISTINCT date_trunc(''month'', date)::date FROM %I',
+                                            parent || '_unpartitioned') LOOP
+                    PERFORM create_month_partition(parent, month);
+                END LOOP;
+                EXECUTE format('INSERT INTO %I SELECT * FROM %I', parent, parent || '_unpartitioned');
+                EXECUTE format('DROP TABLE %I', parent || '_unpartitioned');
+                EXECUTE format('ALTER SEQUENCE %I OWNED BY %I.id', parent || '_id_seq', parent);
+            END IF;
+        END LOOP;
+        IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                       WHERE conrelid = 'expenses'::regclass AND contype = 'f') THEN
+            ALTER TABLE expenses ADD FOREIGN KEY (category_id) REFERENCES categories(id);
+        END IF;
+    END $$
+    """,
+    ]),
+    # Все запросы фильтруют по user_id и диапазону дат: составные индексы вместо
+    # одиночных; по категории - покрывающий, суммы читаются без обращения к таблице
+    (6, "composite indexes", [
+        "DROP INDEX IF EXISTS ix_expenses_id, ix_expenses_user_id, idx_expenses_user_id, idx_expenses_date",
+        "DROP INDEX IF EXISTS ix_income_id, ix_income_user_id, idx_income_user_id, idx_income_date",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_user_date ON expenses (user_id, date)",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_user_category_date ON expenses (user_id, category_id, date) INCLUDE (amount)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_expenses_idempotency_key ON expenses (idempotency_key, date)",
+        "CREATE INDEX IF NOT EXISTS ix_income_user_date ON income (user_id, date) INCLUDE (amount)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_income_idempotency_key ON income (idempotency_key, date)",
+    ]),
+    # id выдаются последовательностью до коммита, поэтому для ленты изменений нужен порядок
+    # фиксации: номер записавшей транзакции. Старые строки получают номер этой миграции.
+    (7, "expense change feed", [
+        "ALTER TABLE expenses ADD COLUMN IF NOT EXISTS xact_id xid8 NOT NULL DEFAULT pg_current_xact_id()",
+        "CREATE INDEX IF NOT EXISTS ix_expenses_user_xact ON expenses (user_id, xact_id, id)",
+    ]),
+    (8, "rollup backfill", [backfill_rollups]),
+]
+
+async def upgrade(conn: AsyncConnection, online: bool = False):
+    """Применяет ещё не применённые миграции по порядку номеров в транзакции conn.
+
+    online - запуск из бэкенда: миграции из OFFLINE на базе с данными не применяются,
+    старт прерывается с подсказкой запустить их отдельно.
+    """
+    # Перестройка больших таблиц идёт дольше DB_STATEMENT_TIMEOUT_MS, рассчитанного на запросы API
+    await conn.execute(text("SET LOCAL statement_timeout = 0"))
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": LOCK_KEY})
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+    ))
+    applied = set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+    offline = sorted(OFFLINE - applied)
+    if online and offline and (await conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM expenses) OR EXISTS (SELECT 1 FROM income)"
+    ))).scalar():
+        raise RuntimeError(
+            f"Migrations {offline} rewrite existing expenses/income; stop the API and run "
+            "'python migrations.py upgrade' before starting it"
+        )
+    for version, name, statements in MIGRATIONS:
+        if version in applied:
+            continue
+        for statement in statements:
+            if callable(statement):
+                await conn.run_sync(statement)
+            else:
+                await conn.execute(text(statement))
+        await conn.execute(
+            text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+            {"version": version, "name": name},
+        )
+
+async def migrate():
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await upgrade(conn)
+        await partitions.create_ahead(conn)
+    await database.async_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы, включая долгие (при остановленном API)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("upgrade", help="применить все непримененные миграции")
+    parser.parse_args()
+
+    asyncio.run(migrate())
+    print("Schema is up to date")
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,80 @@
-from sqlalchemy import Column, Integer, String, Float, Date, DateTime, Text, BigInteger
+from sqlalchemy import Column, Integer, SmallInteger, String, Float, Date, DateTime, Text, BigInteger, ForeignKey, Identity, Index, select
+from sqlalchemy.orm import column_property
 from sqlalchemy.sql import func
 from database import Base
 
+class Category(Base):
+    # Справочник названий категорий: в строках расходов и агрегатах хранится только smallint id
+    __tablename__ = "categories"
+
+    id = Column(SmallInteger, Identity(), primary_key=True)
+    name = Column(String(100), nullable=False, unique=True)
+
+class UserCategory(Base):
+    # Категории, которыми пользовался пользователь, - для /categories/ без прохода по expenses
+    __tablename__ = "user_categories"
+
+    user_id = Column(BigInteger, primary_key=True)
+    category_id = Column(SmallInteger, ForeignKey("categories.id"), primary_key=True)
+
 class Expense(Base):
+    # Таблица разбита на месячные партиции по date (см. partitions.py), поэтому date
+    # входит в первичный ключ и в уникальный индекс по idempotency_key
     __tablename__ = "expenses"
+    __table_args__ = (
+        Index("ix_expenses_user_date", "user_id", "date"),
+        Index("ix_expenses_user_category_date", "user_id", "category_id", "date", postgresql_include=["amount"]),
+        Index("ix_expenses_idempotency_key", "idempotency_key", "date", unique=True),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(BigInteger, index=True)  # ← BIGINT
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger)  # ← BIGINT
     amount = Column(Float, nullable=False)
-    category = Column(String, index=True)
+    category_id = Column(SmallInteger, ForeignKey("categories.id"), nullable=False)
     description = Column(Text, nullable=True)
-    date = Column(Date, nullable=False)
+    date = Column(Date, primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    idempotency_key = Column(String(64), nullable=True)
+    # Название подтягивается из справочника при загрузке строки
+    category = column_property(
+        select(Category.name).where(Category.id == category_id).scalar_subquery()
+    )
 
 class Income(Base):
     __tablename__ = "income"
+    __table_args__ = (
+        Index("ix_income_user_date", "user_id", "date", postgresql_include=["amount"]),
+        Index("ix_income_idempotency_key", "idempotency_key", "date", unique=True),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(BigInteger, index=True)  # ← BIGINT
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger)  # ← BIGINT
     amount = Column(Float, nullable=False)
     source = Column(String)
     description = Column(Text, nullable=True)
-    date = Column(Date, nullable=False)
+    date = Column(Date, primary_key=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    idempotency_key = Column(String(64), nullable=True)
+
+class ExpenseDailyRollup(Base):
+    __tablename__ = "expense_daily_rollup"
+
+    user_id = Column(BigInteger, primary_key=True)
+    day = Column(Date, primary_key=True)
+    category_id = Column(SmallInteger, ForeignKey("categories.id"), primary_key=True)
+    total = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+class UserTotals(Base):
+    __tablename__ = "user_totals"
+
+    user_id = Column(BigInteger, primary_key=True)
+    income_total = Column(Float, nullable=False, default=0)
+    income_count = Column(Integer, nullable=False, default=0)
+    expense_total = Column(Float, nullable=False, default=0)
+    expense_count = Column(Integer, nullable=False, default=0)
+    # Версия данных пользователя: растёт при каждой новой записи, из неё строится ETag
+    version = Column(BigInteger, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
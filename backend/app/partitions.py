@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import os
+import re
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+import database
+
+# expenses и income разбиты на месячные партиции по date (parent_YYYY_MM), запросы
+# с диапазоном дат читают только партиции своих месяцев. Партиции заводятся заранее
+# на PARTITION_MONTHS_AHEAD месяцев вперёд при старте бэкенда и командой maintain,
+# а для строк задним числом (импорт истории) - перед вставкой.
+# Старые партиции maintain отцепляет и переносит в схему archive: raw-строки уходят из
+# запросов, а rollup-агрегаты и итоги их по-прежнему учитывают (но rebuild - уже нет).
+
+PARTITIONED_TABLES = ("expenses", "income")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))  # 0 - не архивировать
+ARCHIVE_SCHEMA = "archive"
+
+# Месяцы, для которых партиция точно есть: вставка не ходит за DDL повторно.
+# Архивацию из другого процесса (maintain по cron) кэш не видит - вставка в такой месяц
+# падает, и forget_if_missing сбрасывает кэш, чтобы повтор завёл партицию заново.
+_known = set()
+
+# check_violation; у вставки без подходящей партиции текст "no partition of relation ... found for row"
+CHECK_VIOLATION = "23514"
+MISSING_DETAIL = "Partition was archived concurrently, retry the request"
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def add_months(month: date, count: int) -> date:
+    years, index = divmod(month.month - 1 + count, 12)
+    return date(month.year + years, index + 1, 1)
+
+def partition_month(table: str, name: str):
+    match = re.fullmatch(rf"{table}_(\d{{4}})_(\d{{2}})", name)
+    return date(int(match[1]), int(match[2]), 1) if match else None
+
+async def create(conn: AsyncConnection, table: str, months):
+    for month in sorted(months):
+        await conn.execute(text("SELECT create_month_partition(:parent, :month)"), {"parent": table, "month": month})
+        _known.add((table, month))
+
+async def ensure(model, dates):
+    """Заводит недостающие партиции под даты вставляемых строк.
+
+    DDL выполняется в отдельной короткой транзакции, чтобы не держать блокировку
+    родительской таблицы до конца транзакции записи. Вызывать до первого запроса
+    сессии эндпоинта: иначе запрос держал бы два соединения пула сразу.
+    """
+    table = model.__tablename__
+    missing = {month_start(day) for day in dates if (table, month_start(day)) not in _known}
+    if missing:
+        async with database.async_engine.begin() as conn:
+            await create(conn, table, missing)
+
+async def create_ahead(conn: AsyncConnection, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    current = month_start(date.today())
+    for table in PARTITIONED_TABLES:
+        await create(conn, table, [add_months(current, n) for n in range(months_ahead + 1)])
+
+async def archive(conn: AsyncConnection, before: date):
+    """Отцепляет партиции месяцев целиком раньше before и переносит их в схему archive."""
+    await conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA}"))
+    archived = []
+    for table in PARTITIONED_TABLES:
+        names = (await conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:parent AS regclass) ORDER BY c.relname"
+        ), {"parent": table})).scalars().all()
+        for name in names:
+            month = partition_month(table, name)
+            if month is None or add_months(month, 1) > before:
+                continue
+            await conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION "{name}"'))
+            await conn.execute(text(f'ALTER TABLE "{name}" SET SCHEMA {ARCHIVE_SCHEMA}'))
+            _known.discard((table, month))
+            archived.append(name)
+    return archived
+
+def forget_if_missing(error) -> bool:
+    """True, если вставка не нашла партицию своего месяца; кэш партиций при этом сбрасывается."""
+    error = getattr(error, "orig", error)
+    if getattr(error, "sqlstate", None) == CHECK_VIOLATION and "no partition" in str(error):
+        _known.clear()
+        return True
+    return False
+
+async def maintain(months_ahead: int, retention_months: int):
+    async with database.async_engine.begin() as conn:
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        await create_ahead(conn, months_ahead)
+        archived = []
+        if retention_months > 0:
+            archived = await archive(conn, add_months(month_start(date.today()), -retention_months))
+    await database.async_engine.dispose()
+    return archived
+
+def main():
+    parser = argparse.ArgumentParser(description="Обслуживание месячных партиций expenses/income")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    maintain_parser = subparsers.add_parser("maintain", help="создать будущие партиции и архивировать старые")
+    maintain_parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    maintain_parser.add_argument("--retention-months", type=int, default=PARTITION_RETENTION_MONTHS,
+                                 help="сколько месяцев хранить в основной таблице, 0 - не архивировать")
+    args = parser.parse_args()
+
+    archived = asyncio.run(maintain(args.months_ahead, args.retention_months))
+    print(f"Partitions created {args.months_ahead} months ahead")
+    for name in archived:
+        print(f"Archived {name} to {ARCHIVE_SCHEMA}.{name}")
+
+if __name__ == "__main__":
+    main()
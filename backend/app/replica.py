@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, text
+import database
+
+logger = logging.getLogger(__name__)
+
+# Чтение с реплики: GET-эндпоинты статистики и списков читают с неё, пока она отвечает
+# и отстаёт не больше REPLICA_MAX_LAG_SECONDS. Пользователь, чьи данные менялись за
+# последние REPLICA_MAX_LAG_SECONDS, читает с primary - так он видит свои записи сразу,
+# а ETag (версия берётся с primary) не описывает данные, которых на реплике ещё нет.
+
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_CHECK_TIMEOUT = float(os.getenv("REPLICA_CHECK_TIMEOUT", "1"))
+
+# Отставание по времени последней применённой транзакции; если всё полученное WAL уже
+# применено, реплика догнала primary. На сервере не в режиме recovery - 0.
+LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+_state = {"checked": None, "lag": None}
+
+async def _measure():
+    async with database.replica_engine.connect() as conn:
+        return float(await conn.scalar(LAG_QUERY))
+
+async def lag():
+    """Отставание реплики в секундах или None, если реплики нет или она недоступна.
+
+    Замер кэшируется на REPLICA_CHECK_INTERVAL, запросы между замерами его не ждут.
+    """
+    if database.replica_engine is None:
+        return None
+    now = time.monotonic()
+    if _state["checked"] is None or now - _state["checked"] >= REPLICA_CHECK_INTERVAL:
+        _state["checked"] = now
+        try:
+            _state["lag"] = await asyncio.wait_for(_measure(), REPLICA_CHECK_TIMEOUT)
+        except Exception as e:
+            mark_unavailable(e)
+    return _state["lag"]
+
+def mark_unavailable(error):
+    # До следующего замера все чтения идут в primary
+    if _state["lag"] is not None:
+        logger.warning(f"Replica unavailable, reading from primary: {error!r}")
+    _state["lag"] = None
+    _state["checked"] = time.monotonic()
+
+async def usable(updated_at=None) -> bool:
+    """Можно ли читать с реплики данные, последний раз изменённые в updated_at."""
+    current = await lag()
+    if current is None or current > REPLICA_MAX_LAG_SECONDS:
+        return False
+    if updated_at is None:
+        return True
+    return updated_at <= datetime.now(timezone.utc) - timedelta(seconds=REPLICA_MAX_LAG_SECONDS)
+
+@asynccontextmanager
+async def session(use_replica: bool):
+    """Сессия для чтения: SELECT идут в реплику, если use_replica.
+
+    Соединение с репликой берётся сразу: если она упала между замерами,
+    запрос целиком переключается на primary, а не падает на первом SELECT.
+    """
+    async with database.AsyncSessionLocal(info={"replica": use_replica}) as db:
+        if use_replica:
+            try:
+                await asyncio.wait_for(db.connection(bind_arguments={"clause": select(1)}), REPLICA_CHECK_TIMEOUT)
+            except Exception as e:
+                mark_unavailable(e)
+                await db.rollback()
+                db.info["replica"] = False
+        yield db
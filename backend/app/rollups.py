@@ -0,0 +1,148 @@
+import argparse
+from sqlalchemy import delete, func, literal, select, text, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import models, database
+
+# Агрегаты обновляются в той же транзакции, что и вставка строки,
+# поэтому /stats/* читают только окно из rollup-таблиц, а не всю историю.
+
+def _upsert_daily():
+    stmt = insert(models.ExpenseDailyRollup)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "day", "category_id"],
+        set_={
+            "total": models.ExpenseDailyRollup.total + stmt.excluded.total,
+            "count": models.ExpenseDailyRollup.count + stmt.excluded.count,
+        },
+    )
+
+def _upsert_totals():
+    stmt = insert(models.UserTotals)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "income_total": models.UserTotals.income_total + stmt.excluded.income_total,
+            "income_count": models.UserTotals.income_count + stmt.excluded.income_count,
+            "expense_total": models.UserTotals.expense_total + stmt.excluded.expense_total,
+            "expense_count": models.UserTotals.expense_count + stmt.excluded.expense_count,
+            "version": models.UserTotals.version + 1,
+            "updated_at": func.now(),
+        },
+    )
+
+async def _execute_many(db: AsyncSession, stmt, rows):
+    # executemany: драйвер склеивает строки в многострочные INSERT ... VALUES пачками
+    if rows:
+        await db.execute(stmt, rows)
+
+async def apply_expenses(db: AsyncSession, expenses):
+    daily, totals = {}, {}
+    for e in expenses:
+        key = (e.user_id, e.date, e.category_id)
+        total, count = daily.get(key, (0.0, 0))
+        daily[key] = (total + e.amount, count + 1)
+        total, count = totals.get(e.user_id, (0.0, 0))
+        totals[e.user_id] = (total + e.amount, count + 1)
+    # Ключи сортируются, чтобы параллельные транзакции брали блокировки в одном порядке
+    await _execute_many(db, _upsert_daily(), [
+        {"user_id": user_id, "day": day, "category_id": category_id, "total": total, "count": count}
+        for (user_id, day, category_id), (total, count) in sorted(daily.items())
+    ])
+    await _execute_many(db, _upsert_totals(), [
+        {"user_id": user_id, "income_total": 0.0, "income_count": 0, "expense_total": total, "expense_count": count}
+        for user_id, (total, count) in sorted(totals.items())
+    ])
+
+async def apply_incomes(db: AsyncSession, incomes):
+    totals = {}
+    for i in incomes:
+        total, count = totals.get(i.user_id, (0.0, 0))
+        totals[i.user_id] = (total + i.amount, count + 1)
+    await _execute_many(db, _upsert_totals(), [
+        {"user_id": user_id, "income_total": total, "income_count": count, "expense_total": 0.0, "expense_count": 0}
+        for user_id, (total, count) in sorted(totals.items())
+    ])
+
+async def apply_expense(db: AsyncSession, expense: models.Expense):
+    await apply_expenses(db, [expense])
+
+async def apply_income(db: AsyncSession, income: models.Income):
+    await apply_incomes(db, [income])
+
+def rebuild(db: Session, user_id=None):
+    """Пересчитывает rollup-таблицы из expenses/income (для всех или одного пользователя)."""
+    # Полный пересчёт долгий: лимит DB_STATEMENT_TIMEOUT_MS рассчитан на запросы API
+    db.execute(text("SET LOCAL statement_timeout = 0"))
+    # Блокируем запись, чтобы параллельные вставки не потерялись и не посчитались дважды
+    db.execute(text("LOCK TABLE expenses, income IN SHARE MODE"))
+
+    rollup_delete = delete(models.ExpenseDailyRollup)
+    totals_delete = delete(models.UserTotals)
+    expenses = select(models.Expense.__table__)
+    income = select(models.Income)
+    if user_id is not None:
+        rollup_delete = rollup_delete.where(models.ExpenseDailyRollup.user_id == user_id)
+        totals_delete = totals_delete.where(models.UserTotals.user_id == user_id)
+        expenses = expenses.where(models.Expense.user_id == user_id)
+        income = income.where(models.Income.user_id == user_id)
+    expenses = expenses.subquery()
+    income = income.subquery()
+
+    db.execute(rollup_delete)
+    db.execute(totals_delete)
+
+    db.execute(insert(models.ExpenseDailyRollup).from_select(
+        ["user_id", "day", "category_id", "total", "count"],
+        select(
+            expenses.c.user_id,
+            expenses.c.date,
+            expenses.c.category_id,
+            func.sum(expenses.c.amount),
+            func.count(),
+        ).group_by(expenses.c.user_id, expenses.c.date, expenses.c.category_id),
+    ))
+
+    per_user = union_all(
+        select(
+            expenses.c.user_id.label("user_id"),
+            literal(0.0).label("income_total"),
+            literal(0).label("income_count"),
+            func.sum(expenses.c.amount).label("expense_total"),
+            func.count().label("expense_count"),
+        ).group_by(expenses.c.user_id),
+        select(
+            income.c.user_id,
+            func.sum(income.c.amount),
+            func.count(),
+            literal(0.0),
+            literal(0),
+        ).group_by(income.c.user_id),
+    ).subquery()
+    db.execute(insert(models.UserTotals).from_select(
+        ["user_id", "income_total", "income_count", "expense_total", "expense_count"],
+        select(
+            per_user.c.user_id,
+            func.sum(per_user.c.income_total),
+            func.sum(per_user.c.income_count),
+            func.sum(per_user.c.expense_total),
+            func.sum(per_user.c.expense_count),
+        ).group_by(per_user.c.user_id),
+    ))
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчёт rollup-таблиц статистики")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="пересчитать агрегаты из сырых данных")
+    rebuild_parser.add_argument("--user-id", type=int, default=None)
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=database.engine)
+    with database.SessionLocal() as db:
+        rebuild(db, user_id=args.user_id)
+        db.commit()
+    print("Rollup tables rebuilt" + (f" for user {args.user_id}" if args.user_id is not None else ""))
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,16 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import date
-from typing import Optional
+from typing import List, Optional
 
 class ExpenseBase(BaseModel):
     user_id: int  # Pydantic int поддерживает большие числа
     amount: float
-    category: str
+    category: str = Field(min_length=1, max_length=100)
     description: Optional[str] = None
     date: date
 
 class ExpenseCreate(ExpenseBase):
-    pass
+    idempotency_key: Optional[str] = Field(None, max_length=64)
 
 class Expense(ExpenseBase):
     id: int
@@ -26,10 +26,77 @@ class IncomeBase(BaseModel):
     date: date
 
 class IncomeCreate(IncomeBase):
-    pass
+    idempotency_key: Optional[str] = Field(None, max_length=64)
 
 class Income(IncomeBase):
     id: int
     
     class Config:
         from_attributes = True
+
+class SummaryStats(BaseModel):
+    today: float
+    week: float
+    month: float
+
+class WindowSummary(BaseModel):
+    name: str
+    start: Optional[date] = None
+    end: Optional[date] = None
+    income: float
+    expenses: float
+    balance: float
+    income_count: int
+    expense_count: int
+
+class Balance(BaseModel):
+    income: float
+    expenses: float
+    balance: float
+
+class CategoryStat(BaseModel):
+    category: str
+    total: float
+    count: int
+
+class DailyStat(BaseModel):
+    date: str
+    total: float
+
+class MonthlyStat(BaseModel):
+    year: int
+    month: int
+    total: float
+
+class CategoryDistribution(BaseModel):
+    category: str
+    count: int
+    mean: float
+    min: float
+    max: float
+    q1: float
+    median: float
+    q3: float
+    lower_whisker: float
+    upper_whisker: float
+    outliers: List[float]
+    kde_x: List[float]
+    kde_y: List[float]
+
+class DashboardBundle(BaseModel):
+    summary: SummaryStats
+    balance: Balance
+    windows: List[WindowSummary]
+    by_category: List[CategoryStat]
+    daily: List[DailyStat]
+    monthly: List[MonthlyStat]
+    expenses: Optional[List[Expense]] = None
+
+class BulkError(BaseModel):
+    line: int
+    errors: List[dict]
+
+class BulkResult(BaseModel):
+    inserted: int
+    duplicates: int = 0
+    errors: List[BulkError]
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta
+from typing import List, NamedTuple, Optional
+from fastapi import HTTPException
+from sqlalchemy import and_, func, literal, select, true, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+import models
+
+MAX_WINDOWS = 20
+DEFAULT_WINDOWS = ["today", "week", "month", "year", "all"]
+
+# Именованные окна - "последние N дней" включительно с сегодняшним, как в /stats/summary/
+NAMED_WINDOWS = {"today": 0, "week": 7, "month": 30, "year": 365}
+
+class Window(NamedTuple):
+    name: str
+    start: Optional[date]
+    end: Optional[date]
+
+def parse_window(spec: str, today: date) -> Window:
+    """Разбирает окно: today/week/month/year/all, 90d или диапазон 2024-01-01..2024-03-31.
+
+    Границы диапазона включительные, любую можно опустить: 2024-01-01.. или ..2024-03-31.
+    """
+    if spec == "all":
+        return Window(spec, None, None)
+    # Относительные окна кончаются сегодня: записи будущими датами в них не попадают
+    if spec in NAMED_WINDOWS:
+        return Window(spec, today - timedelta(days=NAMED_WINDOWS[spec]), today)
+    try:
+        if spec.endswith("d") and spec[:-1].isdigit():
+            return Window(spec, today - timedelta(days=int(spec[:-1])), today)
+        if ".." in spec:
+            start, end = spec.split("..", 1)
+            return Window(spec, date.fromisoformat(start) if start else None, date.fromisoformat(end) if end else None)
+    except ValueError:
+        pass
+    raise HTTPException(status_code=400, detail=f"Invalid window: {spec}")
+
+def parse_windows(specs: List[str]) -> List[Window]:
+    if len(specs) > MAX_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_WINDOWS} windows per request")
+    today = datetime.now().date()
+    return [parse_window(spec, today) for spec in specs]
+
+async def compute(db: AsyncSession, user_id: int, windows: List[Window]) -> List[dict]:
+    """Доходы и расходы пользователя по всем окнам одним запросом.
+
+    Расходы берутся из дневного rollup, доходы - из income; обе выборки склеиваются
+    UNION ALL, а каждое окно считается своим SUM ... FILTER за один проход.
+    """
+    rollup = models.ExpenseDailyRollup
+    rows = union_all(
+        select(literal("expense").label("kind"), rollup.day.label("day"),
+               rollup.total.label("amount"), rollup.count.label("n")).where(rollup.user_id == user_id),
+        select(literal("income"), models.Income.date, models.Income.amount,
+               literal(1)).where(models.Income.user_id == user_id),
+    ).subquery()
+
+    columns = []
+    for i, window in enumerate(windows):
+        bounds = []
+        if window.start is not None:
+            bounds.append(rows.c.day >= window.start)
+        if window.end is not None:
+            bounds.append(rows.c.day <= window.end)
+        condition = and_(*bounds) if bounds else true()
+        columns.append(func.coalesce(func.sum(rows.c.amount).filter(condition), 0).label(f"total_{i}"))
+        columns.append(func.coalesce(func.sum(rows.c.n).filter(condition), 0).label(f"count_{i}"))
+
+    result = {r.kind: r for r in (await db.execute(select(rows.c.kind, *columns).group_by(rows.c.kind))).all()}
+
+    def value(kind, column):
+        row = result.get(kind)
+        return getattr(row, column) if row is not None else 0
+
+    summaries = []
+    for i, window in enumerate(windows):
+        income = float(value("income", f"total_{i}"))
+        expenses = float(value("expense", f"total_{i}"))
+        summaries.append({
+            "name": window.name,
+            "start": window.start,
+            "end": window.end,
+            "income": income,
+            "expenses": expenses,
+            "balance": income - expenses,
+            "income_count": int(value("income", f"count_{i}")),
+            "expense_count": int(value("expense", f"count_{i}")),
+        })
+    return summaries
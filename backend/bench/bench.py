@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from datetime import datetime, timezone
+from fastapi import Response
+from sqlalchemy import event, text
+import generate
+import database, main as api
+
+# Микробенчмарк запросов: для каждого объёма данных генерирует синтетическую историю
+# (generate.py), вызывает функции эндпоинтов напрямую, без HTTP и conditional-кэша,
+# для самого активного и типичного (медианного) пользователя, и сохраняет время
+# выполнения и планы EXPLAIN ANALYZE всех SELECT. С --baseline падает, если медиана
+# выросла больше чем на --threshold.
+
+CASES = {
+    "get_stats_by_category": lambda db, user_id: api.get_stats_by_category(user_id=user_id, days=30, db=db),
+    "get_daily_stats": lambda db, user_id: api.get_daily_stats(user_id=user_id, days=30, db=db),
+    "get_monthly_stats": lambda db, user_id: api.get_monthly_stats(user_id=user_id, db=db),
+    "get_summary": lambda db, user_id: api.get_summary(user_id=user_id, db=db),
+    "get_balance": lambda db, user_id: api.get_balance(user_id=user_id, db=db),
+    # Первая страница, как у бота
+    "get_expenses": lambda db, user_id: api.get_expenses(
+        response=Response(), user_id=user_id, start_date=None, end_date=None, category=None,
+        limit=100, cursor=None, db=db,
+    ),
+    "get_categories": lambda db, user_id: api.get_categories(user_id=user_id, db=db),
+    "get_month_category_stats": lambda db, user_id: api.get_month_category_stats(user_id=user_id, db=db),
+    "get_week_weekday_stats": lambda db, user_id: api.get_week_weekday_stats(user_id=user_id, db=db),
+    "get_distribution": lambda db, user_id: api.get_distribution(user_id=user_id, days=None, db=db),
+    "get_dashboard": lambda db, user_id: api.get_dashboard(
+        user_id=user_id, days=30, include_expenses=False, windows=["today", "week", "month", "year", "all"], db=db,
+    ),
+}
+
+# SQL, выполненный во время вызова: (statement, parameters) в формате драйвера
+_captured = None
+
+@event.listens_for(database.async_engine.sync_engine, "before_cursor_execute")
+def _capture(conn, cursor, statement, parameters, context, executemany):
+    if _captured is not None:
+        _captured.append((statement, parameters))
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+async def pick_users():
+    """Самый активный и медианный по числу расходов пользователь."""
+    async with database.async_engine.connect() as conn:
+        users = (await conn.execute(text(
+            "SELECT user_id, expense_count FROM user_totals WHERE expense_count > 0 ORDER BY expense_count DESC"
+        ))).all()
+    heavy, typical = users[0], users[len(users) // 2]
+    return {"heavy": (heavy.user_id, heavy.expense_count), "typical": (typical.user_id, typical.expense_count)}
+
+async def explain(case, user_id):
+    """Выполняет вызов, перехватывая SQL, и возвращает планы EXPLAIN ANALYZE его SELECT."""
+    global _captured
+    _captured = []
+    try:
+        async with database.AsyncSessionLocal() as db:
+            await case(db, user_id)
+    finally:
+        statements, _captured = _captured, None
+
+    plans = []
+    async with database.async_engine.connect() as conn:
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+                continue
+            rows = (await conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters)).scalars().all()
+            execution = next((line for line in rows if line.startswith("Execution Time:")), "")
+            plans.append({
+                "sql": statement,
+                "execution_ms": float(execution.split(":")[1].split()[0]) if execution else None,
+                "plan": rows,
+            })
+    return plans
+
+async def measure(case, user_id, repeat):
+    async with database.AsyncSessionLocal() as db:
+        await case(db, user_id)  # прогрев: соединение, кэш планов и страниц
+    timings = []
+    for _ in range(repeat):
+        async with database.AsyncSessionLocal() as db:
+            started = time.perf_counter()
+            await case(db, user_id)
+            timings.append(time.perf_counter() - started)
+    return {
+        "median_ms": round(percentile(timings, 50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 95) * 1000, 3),
+        "min_ms": round(min(timings) * 1000, 3),
+    }
+
+async def run(args):
+    await generate.prepare()
+    results = {}
+    for scale in args.scales:
+        await generate.wipe()
+        started = time.monotonic()
+        await generate.generate(scale, args.users, args.months, args.seed)
+        print(f"{scale} rows generated in {time.monotonic() - started:.1f} s")
+        users = await pick_users()
+        scale_results = results[str(scale)] = {}
+        for name in args.cases:
+            scale_results[name] = {}
+            for kind, (user_id, expense_count) in users.items():
+                stats = await measure(CASES[name], user_id, args.repeat)
+                stats["expense_rows"] = expense_count
+                if not args.no_plans:
+                    stats["plans"] = await explain(CASES[name], user_id)
+                scale_results[name][kind] = stats
+    await database.async_engine.dispose()
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {"users": args.users, "months": args.months, "seed": args.seed, "repeat": args.repeat},
+        "results": results,
+    }
+
+def print_report(result):
+    print(f"{'scale':>9}  {'case':<26}{'user':<9}{'rows':>7}{'median':>10}{'p95':>10}{'plan':>10}")
+    for scale, cases in result["results"].items():
+        for name, kinds in cases.items():
+            for kind, s in kinds.items():
+                plan = sum(p["execution_ms"] or 0 for p in s.get("plans", [])) if "plans" in s else None
+                print(f"{scale:>9}  {name:<26}{kind:<9}{s['expense_rows']:>7}{s['median_ms']:>10}{s['p95_ms']:>10}"
+                      f"{round(plan, 3) if plan is not None else '':>10}")
+
+def regressions(baseline, current, threshold, min_delta_ms):
+    """Случаи, где медиана выросла больше чем на threshold (и больше чем на min_delta_ms)."""
+    found = []
+    for scale, cases in current["results"].items():
+        for name, kinds in cases.items():
+            for kind, s in kinds.items():
+                old = baseline["results"].get(scale, {}).get(name, {}).get(kind)
+                if old is None:
+                    continue
+                delta = s["median_ms"] - old["median_ms"]
+                if delta > min_delta_ms and delta > old["median_ms"] * threshold:
+                    found.append(f"{scale} {name} [{kind}]: {old['median_ms']} -> {s['median_ms']} ms "
+                                 f"(+{delta / old['median_ms'] * 100:.0f}%)")
+    return found
+
+def check(baseline_path, result, threshold, min_delta_ms):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    found = regressions(baseline, result, threshold, min_delta_ms)
+    for line in found:
+        print(f"REGRESSION {line}")
+    if found:
+        sys.exit(1)
+    print(f"No regressions over {threshold:.0%} against {baseline_path}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк запросов эндпоинтов на синтетических данных")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="сгенерировать данные и замерить запросы")
+    run_parser.add_argument("--scales", type=lambda s: [int(x) for x in s.split(",")], default=[10_000, 100_000, 1_000_000],
+                            help="объёмы расходов через запятую")
+    run_parser.add_argument("--users", type=int, default=1000)
+    run_parser.add_argument("--months", type=int, default=24)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--repeat", type=int, default=20, help="замеров на случай")
+    run_parser.add_argument("--cases", type=lambda s: s.split(","), default=list(CASES),
+                            help="функции через запятую, по умолчанию все")
+    run_parser.add_argument("--no-plans", action="store_true", help="не снимать EXPLAIN ANALYZE")
+    run_parser.add_argument("--output", help="куда сохранить результат в JSON")
+    run_parser.add_argument("--baseline", help="JSON прошлого прогона для проверки регрессий")
+    run_parser.add_argument("--wipe", action="store_true",
+                            help="подтверждение: прогон удаляет все расходы, доходы и агрегаты в базе DATABASE_URL")
+
+    compare_parser = subparsers.add_parser("compare", help="проверить сохранённый прогон против baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--threshold", type=float, default=0.2, help="допустимый рост медианы, доля")
+        sub.add_argument("--min-delta-ms", type=float, default=0.5, help="рост меньше этого не считается регрессией")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.current) as f:
+            check(args.baseline, json.load(f), args.threshold, args.min_delta_ms)
+        return
+
+    if not args.wipe:
+        parser.error("run очищает таблицы данных; запускайте на отдельной базе и подтвердите флагом --wipe")
+    unknown = set(args.cases) - CASES.keys()
+    if unknown:
+        parser.error(f"неизвестные функции: {', '.join(sorted(unknown))}")
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Saved to {args.output}")
+    if args.baseline:
+        check(args.baseline, result, args.threshold, args.min_delta_ms)
+
+if __name__ == "__main__":
+    main()
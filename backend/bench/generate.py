@@ -0,0 +1,152 @@
+import argparse
+import asyncio
+import os
+import sys
+from datetime import date
+import numpy as np
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+import models, database, migrations, partitions, categories, rollups
+
+# Синтетическая история расходов и доходов для бенчмарков. Генерация детерминирована
+# по seed: одинаковые параметры дают одинаковые данные.
+# - объём на пользователя распределён по Парето: немного активных пользователей дают
+#   большую часть строк, у большинства - десятки-сотни записей;
+# - каждый пользователь ведёт учёт со своей даты начала, записи равномерно по дням этого периода;
+# - категории - с долями и медианными суммами, похожими на реальные траты;
+# - доходы: зарплата раз в месяц и нерегулярный фриланс.
+
+# (категория, доля расходов, медианная сумма)
+CATEGORY_MIX = [
+    ("Еда", 0.38, 450),
+    ("Транспорт", 0.18, 250),
+    ("Развлечения", 0.10, 1500),
+    ("Жилье", 0.04, 25000),
+    ("Одежда", 0.06, 3500),
+    ("Здоровье", 0.06, 1500),
+    ("Образование", 0.03, 5000),
+    ("Подарки", 0.05, 2500),
+    ("Другое", 0.10, 800),
+]
+AMOUNT_SIGMA = 0.8
+SALARY_MEDIAN = 80_000
+FREELANCE_MEDIAN = 15_000
+FREELANCE_PROBABILITY = 0.3
+
+USER_ID_BASE = 800_000_000
+CHUNK_SIZE = 200_000
+EXPENSE_COLUMNS = ["user_id", "amount", "category_id", "date"]
+INCOME_COLUMNS = ["user_id", "amount", "source", "date"]
+
+DATA_TABLES = "expenses, income, expense_daily_rollup, user_totals, user_categories"
+
+async def prepare():
+    # Схема как при старте бэкенда
+    async with database.async_engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await migrations.upgrade(conn)
+        await partitions.create_ahead(conn)
+
+async def wipe():
+    # Справочник categories не трогаем: его id закэшированы в categories._ids
+    async with database.async_engine.begin() as conn:
+        await conn.execute(text(f"TRUNCATE {DATA_TABLES}"))
+
+def user_profiles(rng, users: int, rows: int, months: int):
+    """Число расходов и длительность истории (в днях) на пользователя."""
+    weights = rng.pareto(1.16, users) + 1
+    counts = rng.multinomial(rows, weights / weights.sum())
+    history_days = rng.integers(30, max(31, int(months * 30.4)), users, endpoint=True)
+    return counts, history_days
+
+def expense_chunks(rng, counts, history_days, category_ids, today: date):
+    names, shares, medians = zip(*CATEGORY_MIX)
+    shares = np.array(shares) / sum(shares)
+    log_medians = np.log(medians)
+    ids = np.array([category_ids[name] for name in names])
+    users = np.repeat(np.arange(len(counts)), counts)
+    for start in range(0, len(users), CHUNK_SIZE):
+        chunk = users[start:start + CHUNK_SIZE]
+        offsets = (rng.random(len(chunk)) * history_days[chunk]).astype(np.int64)
+        picked = rng.choice(len(names), len(chunk), p=shares)
+        amounts = np.round(np.exp(rng.normal(log_medians[picked], AMOUNT_SIGMA)), 2)
+        days = today.toordinal() - offsets
+        yield list(zip(
+            (chunk + USER_ID_BASE).tolist(),
+            amounts.tolist(),
+            ids[picked].tolist(),
+            map(date.fromordinal, days.tolist()),
+        ))
+
+def income_rows(rng, history_days, today: date):
+    rows = []
+    current = partitions.month_start(today)
+    for user, days in enumerate(history_days.tolist()):
+        salary = round(float(np.exp(rng.normal(np.log(SALARY_MEDIAN), 0.4))), -3)
+        first = partitions.month_start(date.fromordinal(today.toordinal() - days))
+        month = first
+        while month <= current:
+            payday = month.replace(day=5)
+            if first < payday <= today:
+                rows.append((USER_ID_BASE + user, salary, "Зарплата", payday))
+            if rng.random() < FREELANCE_PROBABILITY:
+                day = month.replace(day=int(rng.integers(1, 29)))
+                if day <= today:
+                    amount = round(float(np.exp(rng.normal(np.log(FREELANCE_MEDIAN), 0.8))), 2)
+                    rows.append((USER_ID_BASE + user, amount, "Фриланс", day))
+            month = partitions.add_months(month, 1)
+    return rows
+
+async def copy(model, columns, records):
+    await partitions.ensure(model, {r[3] for r in records})
+    async with database.async_engine.begin() as conn:
+        driver = (await conn.get_raw_connection()).driver_connection
+        await driver.copy_records_to_table(model.__tablename__, records=records, columns=columns)
+
+async def generate(rows: int, users: int, months: int = 24, seed: int = 42):
+    """Заливает rows расходов на users пользователей и пересчитывает агрегаты; возвращает число доходов."""
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    category_ids = await categories.ids([name for name, _, _ in CATEGORY_MIX])
+    counts, history_days = user_profiles(rng, users, rows, months)
+
+    for records in expense_chunks(rng, counts, history_days, category_ids, today):
+        await copy(models.Expense, EXPENSE_COLUMNS, records)
+    incomes = income_rows(rng, history_days, today)
+    for start in range(0, len(incomes), CHUNK_SIZE):
+        await copy(models.Income, INCOME_COLUMNS, incomes[start:start + CHUNK_SIZE])
+
+    async with database.AsyncSessionLocal() as db:
+        await db.execute(text(
+            "INSERT INTO user_categories (user_id, category_id) "
+            "SELECT DISTINCT user_id, category_id FROM expenses ON CONFLICT DO NOTHING"
+        ))
+        await db.run_sync(rollups.rebuild)
+        await db.commit()
+    async with database.async_engine.begin() as conn:
+        await conn.execute(text(f"ANALYZE {DATA_TABLES}"))
+    return len(incomes)
+
+async def run(args):
+    await prepare()
+    if args.wipe:
+        await wipe()
+    incomes = await generate(args.rows, args.users, args.months, args.seed)
+    await database.async_engine.dispose()
+    return incomes
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических расходов и доходов для бенчмарков")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="число расходов")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--months", type=int, default=24, help="максимальная длина истории пользователя")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--wipe", action="store_true", help="удалить все расходы, доходы и агрегаты перед генерацией")
+    args = parser.parse_args()
+
+    incomes = asyncio.run(run(args))
+    print(f"Generated {args.rows} expenses and {incomes} incomes for {args.users} users")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import uuid
+import pytest
+
+# Тесты идут против настоящего Postgres: COPY, партиции и транзакции на SQLite не проверить.
+# TEST_DATABASE_URL - отдельная база, которую тесты могут менять; без неё тесты пропускаются.
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+if TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = TEST_DATABASE_URL
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.pop("REPLICA_DATABASE_URL", None)
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+else:
+    collect_ignore_glob = ["test_*.py"]
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    # Ошибки эндпоинтов нужны как ответы 500, а не как исключения в тесте
+    with TestClient(main.app, raise_server_exceptions=False) as client:
+        yield client
+
+@pytest.fixture
+def db(client):
+    import database
+    with database.SessionLocal() as session:
+        yield session
+
+@pytest.fixture
+def user_id():
+    # Свой пользователь на каждый тест: база общая, данные между тестами не чистятся
+    return 10**9 + uuid.uuid4().int % 10**9
@@ -0,0 +1,41 @@
+from datetime import date
+import pytest
+from sqlalchemy import func, select
+import models, rollups
+
+def fail(*args, **kwargs):
+    raise RuntimeError("rollup update failed")
+
+def count(db, model, user_id):
+    return db.scalar(select(func.count()).select_from(model).where(model.user_id == user_id))
+
+@pytest.mark.parametrize("keyed", [False, True])
+def test_income_bulk_is_rolled_back_when_rollups_fail(client, db, monkeypatch, user_id, keyed):
+    monkeypatch.setattr(rollups, "apply_incomes", fail)
+    row = {"user_id": user_id, "amount": 100, "source": "Зарплата", "date": date.today().isoformat()}
+    if keyed:
+        row["idempotency_key"] = f"bulk-{user_id}"
+
+    response = client.post("/income/bulk/", json=[row])
+
+    assert response.status_code == 500
+    assert count(db, models.Income, user_id) == 0
+    assert db.get(models.UserTotals, user_id) is None
+
+def test_expense_csv_bulk_is_rolled_back_when_rollups_fail(client, db, monkeypatch, user_id):
+    monkeypatch.setattr(rollups, "apply_expenses", fail)
+    body = f"user_id,amount,category,date\n{user_id},50,Еда,{date.today().isoformat()}\n"
+
+    response = client.post("/expenses/bulk/", content=body.encode(), headers={"content-type": "text/csv"})
+
+    assert response.status_code == 500
+    assert count(db, models.Expense, user_id) == 0
+    assert db.get(models.UserTotals, user_id) is None
+
+def test_income_bulk_updates_balance(client, user_id):
+    rows = [{"user_id": user_id, "amount": 100, "source": "Зарплата", "date": date.today().isoformat()}] * 2
+
+    response = client.post("/income/bulk/", json=rows)
+
+    assert response.json()["inserted"] == 2
+    assert client.get("/balance/", params={"user_id": user_id}).json()["income"] == 200
@@ -0,0 +1,50 @@
+from datetime import date
+from sqlalchemy import insert, select
+import database, models
+
+def fetch_changes(client, user_id, cursor=None, limit=None):
+    params = {"user_id": user_id}
+    if limit:
+        params["limit"] = limit
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get("/expenses/changes/", params=params)
+    assert response.status_code == 200
+    return [e["id"] for e in response.json()], response.headers.get("X-Next-Cursor")
+
+def test_changes_do_not_skip_rows_committed_out_of_order(client, db, user_id):
+    first = client.post("/expenses/", json={"user_id": user_id, "amount": 1, "category": "Еда",
+                                            "date": date.today().isoformat()}).json()
+    category_id = db.scalar(select(models.Category.id).where(models.Category.name == "Еда"))
+    row = {"user_id": user_id, "amount": 2, "category_id": category_id, "date": date.today()}
+
+    # Строка с меньшим id фиксируется позже строки с большим
+    slow = database.engine.connect()
+    slow_id = slow.execute(insert(models.Expense).values(row).returning(models.Expense.id)).scalar_one()
+    with database.engine.begin() as fast:
+        fast_id = fast.execute(insert(models.Expense).values(row).returning(models.Expense.id)).scalar_one()
+    assert slow_id < fast_id
+
+    seen, cursor = fetch_changes(client, user_id)
+    assert seen == [first["id"]]
+
+    slow.commit()
+    slow.close()
+    more, cursor = fetch_changes(client, user_id, cursor)
+    seen += more
+    assert sorted(seen) == sorted([first["id"], slow_id, fast_id])
+
+    # Дальше новых строк нет, курсор остаётся прежним
+    assert fetch_changes(client, user_id, cursor) == ([], cursor)
+
+def test_changes_pages_through_all_rows(client, user_id):
+    rows = [{"user_id": user_id, "amount": i, "category": "Еда", "date": date.today().isoformat()} for i in range(5)]
+    client.post("/expenses/bulk/", json=rows)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = fetch_changes(client, user_id, cursor, limit=2)
+        seen += page
+        if len(page) < 2:
+            break
+    assert len(set(seen)) == 5
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import date
+from typing import List, Optional, TypedDict
+import aiohttp
+import metrics
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.getenv("API_URL", "http://backend:8000")
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "10"))
+API_RETRIES = int(os.getenv("API_RETRIES", "3"))
+API_BACKOFF = float(os.getenv("API_BACKOFF", "0.5"))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "100"))
+
+class Summary(TypedDict):
+    today: float
+    week: float
+    month: float
+
+class WindowSummary(TypedDict):
+    name: str
+    start: Optional[str]
+    end: Optional[str]
+    income: float
+    expenses: float
+    balance: float
+    income_count: int
+    expense_count: int
+
+class Balance(TypedDict):
+    income: float
+    expenses: float
+    balance: float
+
+class CategoryStat(TypedDict):
+    category: str
+    total: float
+    count: int
+
+class DailyStat(TypedDict):
+    date: str
+    total: float
+
+class MonthlyStat(TypedDict):
+    year: int
+    month: int
+    total: float
+
+class BackendError(Exception):
+    """Бэкенд ответил ошибкой (не 200)."""
+
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"Backend returned {status}: {detail}")
+        self.status = status
+        self.detail = detail
+
+class BackendClient:
+    """Долгоживущий клиент бэкенда: один пул keep-alive соединений на весь процесс бота."""
+
+    def __init__(self, base_url=API_URL, timeout=API_TIMEOUT, retries=API_RETRIES,
+                 backoff=API_BACKOFF, pool_size=API_POOL_SIZE):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, path, *, params=None, json=None, idempotent=True):
+        # GET повторяем при сетевых ошибках, таймаутах и 5xx. Неидемпотентные POST -
+        # только если соединение не удалось установить, т.е. запрос точно не ушёл.
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                async with self._session.request(method, f"{self.base_url}{path}", params=params, json=json) as resp:
+                    outcome = str(resp.status)
+                    if resp.status == 200:
+                        return await resp.json()
+                    if resp.status < 500 or not idempotent or last_attempt:
+                        raise BackendError(resp.status, await resp.text())
+                    logger.warning(f"{method} {path} returned {resp.status}, retrying")
+            except aiohttp.ClientConnectorError as e:
+                outcome = type(e).__name__
+                if last_attempt:
+                    raise
+                logger.warning(f"{method} {path} failed to connect ({e}), retrying")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                outcome = type(e).__name__
+                if not idempotent or last_attempt:
+                    raise
+                logger.warning(f"{method} {path} failed ({e!r}), retrying")
+            finally:
+                metrics.observe_backend(method, path, outcome, time.perf_counter() - started)
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def create_expense(self, user_id: int, amount: float, category: str,
+                             description: Optional[str] = None, day: Optional[date] = None,
+                             idempotency_key: Optional[str] = None) -> dict:
+        payload = {
+            "user_id": user_id,
+            "amount": amount,
+            "category": category,
+            "description": description,
+            "date": (day or date.today()).isoformat(),
+            "idempotency_key": idempotency_key,
+        }
+        return await self._request("POST", "/expenses/", json=payload, idempotent=idempotency_key is not None)
+
+    async def create_income(self, user_id: int, amount: float, source: str,
+                            description: Optional[str] = None, day: Optional[date] = None,
+                            idempotency_key: Optional[str] = None) -> dict:
+        payload = {
+            "user_id": user_id,
+            "amount": amount,
+            "source": source,
+            "description": description,
+            "date": (day or date.today()).isoformat(),
+            "idempotency_key": idempotency_key,
+        }
+        return await self._request("POST", "/income/", json=payload, idempotent=idempotency_key is not None)
+
+    async def bulk_create_expenses(self, items: List[dict]) -> dict:
+        # Повтор безопасен, если у строк есть idempotency_key
+        return await self._request("POST", "/expenses/bulk/", json=items,
+                                   idempotent=all(i.get("idempotency_key") for i in items))
+
+    async def bulk_create_income(self, items: List[dict]) -> dict:
+        return await self._request("POST", "/income/bulk/", json=items,
+                                   idempotent=all(i.get("idempotency_key") for i in items))
+
+    async def get_expenses(self, user_id: int, limit: Optional[int] = None, **filters) -> List[dict]:
+        params = {"user_id": user_id, **{k: str(v) for k, v in filters.items() if v is not None}}
+        if limit:
+            params["limit"] = limit
+        return await self._request("GET", "/expenses/", params=params)
+
+    async def get_summary(self, user_id: int) -> Summary:
+        return await self._request("GET", "/stats/summary/", params={"user_id": user_id})
+
+    async def get_windows(self, user_id: int, windows: List[str]) -> List[WindowSummary]:
+        return await self._request("GET", "/stats/windows/", params=[("user_id", str(user_id)), *(("windows", w) for w in windows)])
+
+    async def get_stats_by_category(self, user_id: int, days: int = 30) -> List[CategoryStat]:
+        return await self._request("GET", "/stats/by-category/", params={"user_id": user_id, "days": days})
+
+    async def get_daily_stats(self, user_id: int, days: int = 30) -> List[DailyStat]:
+        return await self._request("GET", "/stats/daily/", params={"user_id": user_id, "days": days})
+
+    async def get_monthly_stats(self, user_id: int) -> List[MonthlyStat]:
+        return await self._request("GET", "/stats/monthly/", params={"user_id": user_id})
+
+    async def get_balance(self, user_id: int) -> Balance:
+        return await self._request("GET", "/balance/", params={"user_id": user_id})
+
+    async def get_categories(self, user_id: int) -> List[str]:
+        return await self._request("GET", "/categories/", params={"user_id": user_id})
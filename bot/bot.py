@@ -1,25 +1,43 @@
 import asyncio
 import logging
 import os
-from datetime import datetime
 from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-import aiohttp
+from api import BackendClient
+from cache import ResponseCache
+from outbox import Outbox
+from storage import PersistentStorage, create_storage
+from webhook import run_webhook
 from keyboards import *
+import metrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-API_URL = os.getenv("API_URL", "http://backend:8000")
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling | webhook
+# Альтернативный адрес Bot API, например локальный fake_telegram.py для тестов
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
 
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
-dp = Dispatcher(storage=storage)
+session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session)
+storage, events_isolation = create_storage()
+dp = Dispatcher(storage=storage, events_isolation=events_isolation)
+api = BackendClient()
+outbox = Outbox(api)
+cache = ResponseCache()
+
+# Метрики: апдейты целиком, хэндлеры, вызовы Bot API, переходы FSM и кэш ответов
+dp.update.outer_middleware(metrics.UpdateMetrics())
+dp.message.middleware(metrics.HandlerMetrics())
+bot.session.middleware(metrics.TelegramMetrics())
+metrics.track_states(storage)
+metrics.watch_cache(cache)
 
 class ExpenseStates(StatesGroup):
     waiting_for_amount = State()
@@ -88,9 +106,14 @@ async def process_expense_amount(message: Message, state: FSMContext):
             "Например: 500 или 1250.50"
         )
 
-@dp.message(ExpenseStates.waiting_for_category)
+# "Отмена" с клавиатуры категорий обрабатывает cancel_handler
+@dp.message(ExpenseStates.waiting_for_category, F.text != "❌ Отмена")
 async def process_expense_category(message: Message, state: FSMContext):
-    category = EXPENSE_CATEGORIES.get(message.text, message.text)
+    category = EXPENSE_CATEGORIES.get(message.text)
+    if category is None:
+        # Только категории с клавиатуры: произвольный текст засорял бы справочник на бэкенде
+        await message.answer("❌ Выбери категорию кнопкой ниже", reply_markup=get_category_keyboard())
+        return
     await state.update_data(category=category)
     await state.set_state(ExpenseStates.waiting_for_description)
     await message.answer(
@@ -104,36 +127,22 @@ async def process_expense_description(message: Message, state: FSMContext):
     data = await state.get_data()
     description = None if message.text == "⏭ Пропустить" else message.text
     
-    async with aiohttp.ClientSession() as session:
-        payload = {
-            "user_id": message.from_user.id,
-            "amount": data['amount'],
-            "category": data['category'],
-            "description": description,
-            "date": datetime.now().date().isoformat()
-        }
-        
-        try:
-            async with session.post(f"{API_URL}/expenses/", json=payload) as resp:
-                if resp.status == 200:
-                    await message.answer(
-                        "✅ Расход успешно добавлен!\n\n"
-                        f"💰 Сумма: {data['amount']} руб.\n"
-                        f"📂 Категория: {data['category']}\n"
-                        f"📝 Описание: {description or 'Нет'}",
-                        reply_markup=get_main_keyboard()
-                    )
-                else:
-                    await message.answer(
-                        "❌ Ошибка при сохранении расхода",
-                        reply_markup=get_main_keyboard()
-                    )
-        except Exception as e:
-            logger.error(f"Error saving expense: {e}")
-            await message.answer(
-                "❌ Ошибка подключения к серверу",
-                reply_markup=get_main_keyboard()
-            )
+    try:
+        # Запись уходит на бэкенд в фоне, пользователь не ждёт
+        await outbox.add_expense(message.from_user.id, data['amount'], data['category'], description)
+        await message.answer(
+            "✅ Расход успешно добавлен!\n\n"
+            f"💰 Сумма: {data['amount']} руб.\n"
+            f"📂 Категория: {data['category']}\n"
+            f"📝 Описание: {description or 'Нет'}",
+            reply_markup=get_main_keyboard()
+        )
+    except Exception as e:
+        logger.error(f"Error saving expense: {e}")
+        await message.answer(
+            "❌ Ошибка при сохранении расхода",
+            reply_markup=get_main_keyboard()
+        )
     
     await state.clear()
 
@@ -169,84 +178,69 @@ async def process_income_source(message: Message, state: FSMContext):
     data = await state.get_data()
     source = message.text
     
-    async with aiohttp.ClientSession() as session:
-        payload = {
-            "user_id": message.from_user.id,
-            "amount": data['amount'],
-            "source": source,
-            "date": datetime.now().date().isoformat()
-        }
-        
-        try:
-            async with session.post(f"{API_URL}/income/", json=payload) as resp:
-                if resp.status == 200:
-                    await message.answer(
-                        "✅ Доход успешно добавлен!\n\n"
-                        f"💵 Сумма: {data['amount']} руб.\n"
-                        f"📂 Источник: {source}",
-                        reply_markup=get_main_keyboard()
-                    )
-                else:
-                    await message.answer(
-                        "❌ Ошибка при сохранении дохода",
-                        reply_markup=get_main_keyboard()
-                    )
-        except Exception as e:
-            logger.error(f"Error saving income: {e}")
-            await message.answer(
-                "❌ Ошибка подключения к серверу",
-                reply_markup=get_main_keyboard()
-            )
+    try:
+        await outbox.add_income(message.from_user.id, data['amount'], source)
+        await message.answer(
+            "✅ Доход успешно добавлен!\n\n"
+            f"💵 Сумма: {data['amount']} руб.\n"
+            f"📂 Источник: {source}",
+            reply_markup=get_main_keyboard()
+        )
+    except Exception as e:
+        logger.error(f"Error saving income: {e}")
+        await message.answer(
+            "❌ Ошибка при сохранении дохода",
+            reply_markup=get_main_keyboard()
+        )
     
     await state.clear()
 
 @dp.message(Command("stats"))
 @dp.message(F.text == "📊 Статистика")
 async def cmd_stats(message: Message):
-    user_id = message.from_user.id
+    try:
+        stats_text = await cache.get_or_render(message.from_user.id, "stats", lambda: render_stats(message.from_user.id))
+        await message.answer(stats_text, parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"Error getting stats: {e}")
+        await message.answer("❌ Ошибка получения статистики")
+
+async def render_stats(user_id: int) -> str:
+    windows, by_category = await asyncio.gather(
+        api.get_windows(user_id, ["today", "week", "month"]),
+        api.get_stats_by_category(user_id, days=30)
+    )
+    summary = {w['name']: w['expenses'] for w in windows}
+    
+    stats_text = "📊 **Статистика расходов**\n\n"
+    stats_text += f"📅 Сегодня: {summary['today']:.2f} руб.\n"
+    stats_text += f"📅 За неделю: {summary['week']:.2f} руб.\n"
+    stats_text += f"📅 За месяц: {summary['month']:.2f} руб.\n\n"
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(f"{API_URL}/stats/summary/?user_id={user_id}") as resp:
-                summary = await resp.json()
-            
-            async with session.get(f"{API_URL}/stats/by-category/?user_id={user_id}&days=30") as resp:
-                by_category = await resp.json()
-            
-            stats_text = "📊 **Статистика расходов**\n\n"
-            stats_text += f"📅 Сегодня: {summary['today']:.2f} руб.\n"
-            stats_text += f"📅 За неделю: {summary['week']:.2f} руб.\n"
-            stats_text += f"📅 За месяц: {summary['month']:.2f} руб.\n\n"
-            
-            if by_category:
-                stats_text += "📂 **По категориям (30 дней):**\n"
-                for cat in sorted(by_category, key=lambda x: x['total'], reverse=True)[:5]:
-                    stats_text += f"• {cat['category']}: {cat['total']:.2f} руб.\n"
-            
-            await message.answer(stats_text, parse_mode="Markdown")
-        except Exception as e:
-            logger.error(f"Error getting stats: {e}")
-            await message.answer("❌ Ошибка получения статистики")
+    if by_category:
+        stats_text += "📂 **По категориям (30 дней):**\n"
+        for cat in sorted(by_category, key=lambda x: x['total'], reverse=True)[:5]:
+            stats_text += f"• {cat['category']}: {cat['total']:.2f} руб.\n"
+    return stats_text
 
 @dp.message(Command("balance"))
 @dp.message(F.text == "💼 Баланс")
 async def cmd_balance(message: Message):
-    user_id = message.from_user.id
+    try:
+        balance_text = await cache.get_or_render(message.from_user.id, "balance", lambda: render_balance(message.from_user.id))
+        await message.answer(balance_text, parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"Error getting balance: {e}")
+        await message.answer("❌ Ошибка получения баланса")
+
+async def render_balance(user_id: int) -> str:
+    balance_data = await api.get_balance(user_id)
     
-    async with aiohttp.ClientSession() as session:
-        try:
-            async with session.get(f"{API_URL}/balance/?user_id={user_id}") as resp:
-                balance_data = await resp.json()
-            
-            balance_text = "💼 **Баланс**\n\n"
-            balance_text += f"💵 Доходы: {balance_data['income']:.2f} руб.\n"
-            balance_text += f"💸 Расходы: {balance_data['expenses']:.2f} руб.\n"
-            balance_text += f"{'💰' if balance_data['balance'] >= 0 else '⚠️'} Остаток: {balance_data['balance']:.2f} руб."
-            
-            await message.answer(balance_text, parse_mode="Markdown")
-        except Exception as e:
-            logger.error(f"Error getting balance: {e}")
-            await message.answer("❌ Ошибка получения баланса")
+    balance_text = "💼 **Баланс**\n\n"
+    balance_text += f"💵 Доходы: {balance_data['income']:.2f} руб.\n"
+    balance_text += f"💸 Расходы: {balance_data['expenses']:.2f} руб.\n"
+    balance_text += f"{'💰' if balance_data['balance'] >= 0 else '⚠️'} Остаток: {balance_data['balance']:.2f} руб."
+    return balance_text
 
 @dp.message(Command("report"))
 @dp.message(F.text == "📈 Дашборд")
@@ -271,9 +265,32 @@ async def cancel_handler(message: Message, state: FSMContext):
         reply_markup=get_main_keyboard()
     )
 
+async def invalidate_cache(user_ids):
+    # Новые записи дошли до бэкенда - готовые ответы этих пользователей устарели
+    cache.invalidate(user_ids)
+
+@dp.startup()
+async def on_startup():
+    metrics.start()
+    await api.start()
+    outbox.on_delivered = invalidate_cache
+    await outbox.start()
+    if isinstance(storage, PersistentStorage):
+        await storage.start()
+
+@dp.shutdown()
+async def on_shutdown():
+    # Сначала досылаем накопленные записи, потом закрываем клиент
+    await outbox.close()
+    await api.close()
+    logger.info(f"Response cache: {cache.stats()}")
+
 async def main():
-    logger.info("Starting bot...")
-    await dp.start_polling(bot)
+    logger.info(f"Starting bot in {BOT_MODE} mode...")
+    if BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+    else:
+        await dp.start_polling(bot)
 
 if __name__ == "__main__":
     asyncio.run(main())
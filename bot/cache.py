@@ -0,0 +1,80 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+import metrics
+
+CACHE_SIZE = int(os.getenv("CACHE_SIZE", "10000"))  # пользователей
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+
+class ResponseCache:
+    """LRU-кэш готовых ответов бота (статистика, баланс) по пользователю с TTL.
+
+    Цифры меняются только когда пользователь добавляет запись, поэтому запись
+    сбрасывается через invalidate() после доставки операций на бэкенд; TTL
+    страхует от изменений в обход бота и от смены дня.
+    """
+
+    def __init__(self, maxsize: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict[str, Tuple[float, str]]]" = OrderedDict()
+        # Поколение пользователя растёт при инвалидации во время рендера: ответ, начатый
+        # до неё, не попадёт в кэш и не перетрёт свежие данные устаревшими. Поколения
+        # и счётчики хранятся только пока у пользователя есть незавершённые рендеры.
+        self._generations: Dict[int, int] = {}
+        self._rendering: Dict[int, int] = {}
+
+    async def get_or_render(self, user_id: int, kind: str, render: Callable[[], Awaitable[str]]) -> str:
+        entry = self._entries.get(user_id)
+        if entry is not None and kind in entry:
+            expires_at, text = entry[kind]
+            if expires_at > time.monotonic():
+                self.hits += 1
+                metrics.CACHE_REQUESTS.labels(kind, "hit").inc()
+                self._entries.move_to_end(user_id)
+                return text
+        self.misses += 1
+        metrics.CACHE_REQUESTS.labels(kind, "miss").inc()
+
+        generation = self._generations.get(user_id, 0)
+        self._rendering[user_id] = self._rendering.get(user_id, 0) + 1
+        try:
+            text = await render()
+        finally:
+            fresh = self._generations.get(user_id, 0) == generation
+            left = self._rendering.pop(user_id) - 1
+            if left:
+                self._rendering[user_id] = left
+            else:
+                self._generations.pop(user_id, None)
+        if fresh:
+            self._store(user_id, kind, text)
+        return text
+
+    def _store(self, user_id: int, kind: str, text: str):
+        entry = self._entries.setdefault(user_id, {})
+        entry[kind] = (time.monotonic() + self.ttl, text)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[int]):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+            if user_id in self._rendering:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
@@ -0,0 +1,125 @@
+"""Локальный имитатор Telegram для проверки webhook-режима бота.
+
+Поднимает фейковый Bot API (бот направляется на него через TELEGRAM_API_URL)
+и прогоняет через вебхук сценарии пользователей: /start, добавление расхода,
+статистика, баланс. Каждое следующее сообщение отправляется после ответа бота
+на предыдущее, как это делал бы живой пользователь.
+
+Пример:
+    python fake_telegram.py --webhook http://localhost:8080/webhook --secret s3cret --users 20
+    # бот запущен с BOT_MODE=webhook WEBHOOK_SET=false WEBHOOK_SECRET=s3cret
+    #                TELEGRAM_API_URL=http://localhost:8081
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+from collections import Counter, defaultdict
+import aiohttp
+from aiohttp import web
+
+SCENARIO = [
+    "/start",
+    "💸 Добавить расход",
+    "500",
+    "🍔 Еда",
+    "⏭ Пропустить",
+    "💵 Добавить доход",
+    "50000",
+    "💼 Зарплата",
+    "📊 Статистика",
+    "💼 Баланс",
+]
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+class FakeTelegram:
+    def __init__(self):
+        self.replies = defaultdict(asyncio.Queue)
+        self.message_ids = itertools.count(1)
+        self.update_ids = itertools.count(1)
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        if method == "getMe":
+            result = BOT_USER
+        elif method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            self.replies[chat_id].put_nowait(params.get("text", ""))
+            result = {
+                "message_id": next(self.message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def make_update(self, user_id: int, text: str) -> dict:
+        message = {
+            "message_id": next(self.message_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return {"update_id": next(self.update_ids), "message": message}
+
+async def run_user(fake, session, args, user_id, statuses, latencies):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    for text in SCENARIO:
+        started = time.perf_counter()
+        async with session.post(args.webhook, json=fake.make_update(user_id, text), headers=headers) as resp:
+            statuses[resp.status] += 1
+            if resp.status != 200:
+                continue
+        try:
+            await asyncio.wait_for(fake.replies[user_id].get(), timeout=args.reply_timeout)
+            latencies.append(time.perf_counter() - started)
+        except asyncio.TimeoutError:
+            statuses["no_reply"] += 1
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake Telegram for webhook mode testing")
+    parser.add_argument("--webhook", default="http://localhost:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--first-user-id", type=int, default=1_000_000)
+    parser.add_argument("--api-host", default="0.0.0.0")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--reply-timeout", type=float, default=10)
+    args = parser.parse_args()
+
+    fake = FakeTelegram()
+    app = web.Application()
+    app.router.add_route("*", "/bot{token}/{method}", fake.handle_api)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, args.api_host, args.api_port).start()
+
+    statuses, latencies = Counter(), []
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        await asyncio.gather(*(
+            run_user(fake, session, args, args.first_user_id + i, statuses, latencies)
+            for i in range(args.users)
+        ))
+    elapsed = time.perf_counter() - started
+    await runner.cleanup()
+
+    print(f"Users: {args.users}, updates: {sum(v for k, v in statuses.items() if k != 'no_reply')}, "
+          f"elapsed: {elapsed:.2f}s")
+    print(f"Statuses: {dict(statuses)}")
+    if latencies:
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print(f"Reply latency: p50={quantiles[49] * 1000:.1f}ms p95={quantiles[94] * 1000:.1f}ms "
+              f"max={max(latencies) * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
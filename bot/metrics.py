@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.fsm.state import State
+from aiogram.types import TelegramObject, Update
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# Метрики бота для Prometheus (HTTP-сервер на METRICS_PORT): время обработки апдейтов
+# и отдельных хэндлеров, вызовы Bot API и бэкенда, время в состояниях FSM, очередь
+# апдейтов webhook-режима. По каждому апдейту собирается трасса - хэндлер, состояние,
+# вызовы бэкенда и Telegram с длительностями; апдейты дольше SLOW_UPDATE_SECONDS
+# пишутся в лог одной JSON-строкой, чтобы было видно, на что ушло время.
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9101"))  # 0 - не поднимать HTTP-сервер
+SLOW_UPDATE_SECONDS = float(os.getenv("SLOW_UPDATE_SECONDS", "2"))  # 0 - не логировать
+MAX_TRACKED_DIALOGS = 10_000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DWELL_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 86400)
+
+UPDATE_SECONDS = Histogram("bot_update_duration_seconds", "Update processing time", ["type"], buckets=LATENCY_BUCKETS)
+UPDATES_IN_PROGRESS = Gauge("bot_updates_in_progress", "Updates being processed")
+HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Handler time", ["handler"], buckets=LATENCY_BUCKETS)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised", ["handler"])
+STATE_DWELL_SECONDS = Histogram("bot_fsm_state_dwell_seconds", "Time spent in an FSM state", ["state"],
+                                buckets=DWELL_BUCKETS)
+BACKEND_SECONDS = Histogram("bot_backend_request_duration_seconds", "Backend request time (each attempt)",
+                            ["method", "endpoint"], buckets=LATENCY_BUCKETS)
+BACKEND_REQUESTS = Counter("bot_backend_requests_total", "Backend requests by outcome (status or error)",
+                           ["method", "endpoint", "outcome"])
+TELEGRAM_SECONDS = Histogram("bot_telegram_request_duration_seconds", "Bot API request time", ["method"],
+                             buckets=LATENCY_BUCKETS)
+TELEGRAM_ERRORS = Counter("bot_telegram_errors_total", "Bot API requests that raised", ["method", "error"])
+QUEUE_DEPTH = Gauge("bot_update_queue_depth", "Updates waiting in the webhook queue")
+QUEUE_WAIT_SECONDS = Histogram("bot_update_queue_wait_seconds", "Time an update waited in the webhook queue",
+                               buckets=LATENCY_BUCKETS)
+CACHE_REQUESTS = Counter("bot_response_cache_requests_total", "Response cache lookups", ["kind", "result"])
+CACHE_USERS = Gauge("bot_response_cache_users", "Users with cached responses")
+
+# Трасса текущего апдейта; вне обработки апдейта (отправка outbox) - None
+_trace: ContextVar[Optional[dict]] = ContextVar("trace", default=None)
+
+def start(port: int = METRICS_PORT):
+    if port:
+        start_http_server(port)
+        logger.info(f"Metrics available on :{port}/metrics")
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+class UpdateMetrics(BaseMiddleware):
+    """Внешний middleware апдейтов: общее время, число апдейтов в обработке и лог медленных."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: Update, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        trace = {
+            "update_id": event.update_id,
+            "user_id": user.id if user else None,
+            "state": data.get("raw_state"),
+            "handler": None,
+            "backend": [],
+            "telegram": [],
+        }
+        queue_wait = data.get("queue_wait")
+        if queue_wait is not None:
+            trace["queue_wait_ms"] = _ms(queue_wait)
+        token = _trace.set(trace)
+        UPDATES_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            elapsed = time.perf_counter() - started
+            UPDATES_IN_PROGRESS.dec()
+            UPDATE_SECONDS.labels(event.event_type).observe(elapsed)
+            _trace.reset(token)
+            if SLOW_UPDATE_SECONDS and elapsed >= SLOW_UPDATE_SECONDS:
+                logger.warning(json.dumps({"event": "slow_update", "total_ms": _ms(elapsed), **trace}, ensure_ascii=False))
+
+class HandlerMetrics(BaseMiddleware):
+    """Внутренний middleware: время конкретного хэндлера (cmd_stats, process_expense_description, ...)."""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HANDLER_SECONDS.labels(name).observe(elapsed)
+            trace = _trace.get()
+            if trace is not None:
+                trace["handler"] = name
+                trace["handler_ms"] = _ms(elapsed)
+
+class TelegramMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: время запросов к Bot API по методу (SendMessage, ...)."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        if name == "GetUpdates":
+            # Long polling ждёт апдейтов десятки секунд - это не задержка ответа
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_ERRORS.labels(name, type(e).__name__).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            TELEGRAM_SECONDS.labels(name).observe(elapsed)
+            trace = _trace.get()
+            if trace is not None:
+                trace["telegram"].append({"method": name, "ms": _ms(elapsed)})
+
+def observe_backend(method: str, endpoint: str, outcome: str, seconds: float):
+    """Одна попытка запроса к бэкенду; outcome - HTTP-статус или имя исключения."""
+    BACKEND_SECONDS.labels(method, endpoint).observe(seconds)
+    BACKEND_REQUESTS.labels(method, endpoint, outcome).inc()
+    trace = _trace.get()
+    if trace is not None:
+        trace["backend"].append({"method": method, "endpoint": endpoint, "outcome": outcome, "ms": _ms(seconds)})
+
+# Когда диалог вошёл в текущее состояние: ключ хранилища -> (состояние, время).
+# Учёт в памяти процесса: если диалог продолжился на другой реплике, время не учтётся.
+_entered: Dict[Any, tuple] = {}
+
+def track_states(storage):
+    """Считает время в состояниях FSM по переходам, которые проходят через storage.set_state."""
+    set_state = storage.set_state
+
+    async def tracked_set_state(key, state=None):
+        await set_state(key, state)
+        name = state.state if isinstance(state, State) else state
+        now = time.monotonic()
+        previous = _entered.pop(key, None)
+        if previous is not None and previous[0] == name:
+            _entered[key] = previous
+            return
+        if previous is not None:
+            STATE_DWELL_SECONDS.labels(previous[0]).observe(now - previous[1])
+        if name is not None:
+            _entered[key] = (name, now)
+            # Брошенные диалоги не копятся: вытесняем самые старые
+            while len(_entered) > MAX_TRACKED_DIALOGS:
+                _entered.pop(next(iter(_entered)))
+
+    storage.set_state = tracked_set_state
+
+def watch_queue(queue):
+    QUEUE_DEPTH.set_function(queue.qsize)
+
+def observe_queue_wait(seconds: float):
+    QUEUE_WAIT_SECONDS.observe(seconds)
+
+def watch_cache(cache):
+    CACHE_USERS.set_function(lambda: len(cache))
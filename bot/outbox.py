@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+from typing import Awaitable, Callable, Optional, Set
+from api import BackendClient, BackendError
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_PATH = os.getenv("OUTBOX_PATH", "outbox.sqlite3")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_FLUSH_INTERVAL = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "5"))
+OUTBOX_MAX_BACKOFF = float(os.getenv("OUTBOX_MAX_BACKOFF", "60"))
+OUTBOX_SHUTDOWN_TIMEOUT = float(os.getenv("OUTBOX_SHUTDOWN_TIMEOUT", "10"))
+# После стольких неудачных отправок пачки записи уходят по одной: непроходящая не держит остальные
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Ответы, которые повтор не исправит: запись невалидна и уходит в outbox_dead. Остальные
+# 4xx (404/405 во время выкладки, 429), 5xx и сетевые ошибки повторяются с backoff, пока
+# запись не пройдёт: пользователю уже ответили, что она добавлена
+POISON_STATUSES = {400, 422}
+# Сколько записей подряд может не пройти по одной, пока ни одна не прошла: дальше считаем,
+# что недоступен бэкенд, а не записи
+SINGLE_ABORT_FAILURES = 3
+
+KINDS = ("expense", "income")
+
+class Outbox:
+    """Локальная очередь записей для бэкенда (write-behind).
+
+    Запись сначала сохраняется в SQLite на диске, пользователь сразу получает
+    подтверждение, а фоновая задача отправляет накопившиеся записи пачками через
+    /expenses/bulk/ и /income/bulk/. У каждой записи свой idempotency_key, поэтому
+    повторная отправка после сбоя не создаёт дублей.
+    """
+
+    def __init__(self, api: BackendClient, path: str = OUTBOX_PATH, batch_size: int = OUTBOX_BATCH_SIZE,
+                 flush_interval: float = OUTBOX_FLUSH_INTERVAL, max_backoff: float = OUTBOX_MAX_BACKOFF,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.api = api
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        # Вызывается с id пользователей, чьи записи доставлены на бэкенд
+        self.on_delivered: Optional[Callable[[Set[int]], Awaitable[None]]] = None
+        self.conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def _run(self, fn, *args):
+        def call():
+            with self._lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = fn(self.conn, *args)
+                except BaseException:
+                    self.conn.execute("ROLLBACK")
+                    raise
+                self.conn.execute("COMMIT")
+                return result
+        return asyncio.to_thread(call)
+
+    async def start(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        for table in ("outbox", "outbox_dead"):
+            self.conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    error TEXT
+                )
+            """)
+        # Число неудачных отправок записи; в файлах старых версий колонки нет
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(outbox)")}
+        if "attempts" not in columns:
+            self.conn.execute("ALTER TABLE outbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._task = asyncio.create_task(self._flush_loop())
+        if await self.pending():
+            self._wakeup.set()
+
+    async def close(self, timeout: float = OUTBOX_SHUTDOWN_TIMEOUT):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Последняя попытка доставить накопленное; что не ушло - останется на диске до рестарта
+        try:
+            await asyncio.wait_for(self.flush(), timeout=timeout)
+        except Exception as e:
+            logger.warning(f"Outbox not fully flushed on shutdown: {e!r}")
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    async def add(self, kind: str, user_id: int, **fields) -> str:
+        key = uuid.uuid4().hex
+        payload = {"user_id": user_id, "date": date.today().isoformat(), "idempotency_key": key, **fields}
+
+        def op(conn):
+            conn.execute(
+                "INSERT INTO outbox (kind, user_id, payload, created_at) VALUES (?, ?, ?, ?)",
+                (kind, user_id, json.dumps(payload), time.time()),
+            )
+        await self._run(op)
+        self._wakeup.set()
+        return key
+
+    async def add_expense(self, user_id: int, amount: float, category: str, description: Optional[str] = None) -> str:
+        return await self.add("expense", user_id, amount=amount, category=category, description=description)
+
+    async def add_income(self, user_id: int, amount: float, source: str, description: Optional[str] = None) -> str:
+        return await self.add("income", user_id, amount=amount, source=source, description=description)
+
+    async def pending(self) -> int:
+        return await self._run(lambda conn: conn.execute("SELECT count(*) FROM outbox").fetchone()[0])
+
+    async def _flush_loop(self):
+        backoff = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                backoff = self.flush_interval
+            except Exception as e:
+                logger.warning(f"Outbox flush failed, retrying in {backoff:.0f}s: {e!r}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    async def flush(self) -> int:
+        """Отправляет всё накопленное пачками; возвращает число обработанных записей."""
+        processed = 0
+        error = None
+        for kind in KINDS:
+            # Застрявшие расходы не должны задерживать доходы: ошибка пробрасывается в конце
+            try:
+                while True:
+                    sent = await self._flush_batch(kind)
+                    processed += sent
+                    if sent < self.batch_size:
+                        break
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+        return processed
+
+    async def _send(self, kind: str, items) -> dict:
+        """Отправляет записи; возвращает {номер строки: ошибка} для отвергнутых по отдельности."""
+        send = self.api.bulk_create_expenses if kind == "expense" else self.api.bulk_create_income
+        result = await send(items)
+        # Номера строк в ответе - позиции в массиве начиная с 1
+        return {e["line"]: json.dumps(e["errors"], ensure_ascii=False) for e in result["errors"]}
+
+    async def _flush_batch(self, kind: str) -> int:
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT id, user_id, payload, attempts FROM outbox WHERE kind = ? ORDER BY id LIMIT ?",
+            (kind, self.batch_size),
+        ).fetchall())
+        if not rows:
+            return 0
+        if rows[0][3] >= self.max_attempts:
+            return await self._flush_single(kind, rows)
+
+        try:
+            rejected = await self._send(kind, [json.loads(payload) for _, _, payload, _ in rows])
+        except BackendError as e:
+            if e.status in POISON_STATUSES:
+                # Пачку отверг кто-то из записей - выясняем кто, отправляя по одной
+                return await self._flush_single(kind, rows)
+            await self._count_attempts([row_id for row_id, _, _, _ in rows])
+            raise
+        except Exception:
+            await self._count_attempts([row_id for row_id, _, _, _ in rows])
+            raise
+
+        dead = [(row_id, error) for line, (row_id, _, _, _) in enumerate(rows, start=1) if (error := rejected.get(line))]
+        await self._finish(kind, rows, dead)
+        return len(rows)
+
+    async def _flush_single(self, kind: str, rows) -> int:
+        """Отправляет записи по одной, чтобы одна непроходящая не держала очередь.
+
+        Первыми идут записи с меньшим числом попыток. В outbox_dead уходят только
+        отвергнутые как невалидные; остальные непрошедшие остаются в очереди, а после
+        доставки прошедших ошибка пробрасывается, чтобы следующая попытка была с backoff.
+        """
+        done, dead, failed = [], [], []
+        error = None
+        for row in sorted(rows, key=lambda r: (r[3], r[0])):
+            row_id, _, payload, _ = row
+            try:
+                rejected = await self._send(kind, [json.loads(payload)])
+            except Exception as e:
+                if isinstance(e, BackendError) and e.status in POISON_STATUSES:
+                    dead.append((row_id, e.detail))
+                    done.append(row)
+                    continue
+                failed.append(row_id)
+                error = e
+                # Ни одна запись не прошла - скорее всего, недоступен сам бэкенд
+                if not done and len(failed) >= SINGLE_ABORT_FAILURES:
+                    break
+                continue
+            if rejected:
+                dead.append((row_id, rejected[1]))
+            done.append(row)
+
+        await self._finish(kind, done, dead)
+        if failed:
+            await self._count_attempts(failed)
+            raise error
+        return len(done)
+
+    async def _count_attempts(self, row_ids):
+        await self._run(lambda conn: conn.executemany(
+            "UPDATE outbox SET attempts = attempts + 1 WHERE id = ?", [(row_id,) for row_id in row_ids]
+        ))
+
+    async def _finish(self, kind: str, rows, dead):
+        """Убирает обработанные записи из outbox, отвергнутые (dead) - в outbox_dead."""
+        def op(conn):
+            conn.executemany(
+                "INSERT INTO outbox_dead (kind, user_id, payload, created_at, error) "
+                "SELECT kind, user_id, payload, created_at, ? FROM outbox WHERE id = ?",
+                [(error, row_id) for row_id, error in dead],
+            )
+            conn.executemany("DELETE FROM outbox WHERE id = ?", [(row[0],) for row in rows])
+        await self._run(op)
+
+        if dead:
+            logger.error(f"Outbox: {len(dead)} {kind} records rejected by backend, moved to outbox_dead")
+        dead_ids = {row_id for row_id, _ in dead}
+        delivered = {user_id for row_id, user_id, _, _ in rows if row_id not in dead_ids}
+        if delivered and self.on_delivered is not None:
+            await self.on_delivered(delivered)
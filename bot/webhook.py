@@ -0,0 +1,128 @@
+import asyncio
+import hmac
+import logging
+import os
+import re
+import signal
+import time
+from typing import List, Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+import metrics
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "20"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+WEBHOOK_SET = os.getenv("WEBHOOK_SET", "true").lower() in ("1", "true", "yes")
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Ограничения Bot API на secret_token
+SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+class WebhookServer:
+    """Принимает апдейты от Telegram по HTTP и обрабатывает их пулом воркеров.
+
+    Запрос подтверждается сразу после постановки в очередь. Если очередь заполнена,
+    отвечаем 503 - Telegram повторит доставку позже. Без секрета сервер не запускается:
+    иначе любой, кто достучится до порта, сможет слать апдейты от имени любого пользователя.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, secret: str = WEBHOOK_SECRET,
+                 workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE):
+        if not SECRET_PATTERN.fullmatch(secret or ""):
+            raise ValueError("WEBHOOK_SECRET must be set to 1-256 characters of A-Z, a-z, 0-9, _ and -")
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        self.workers = workers
+        # (апдейт, время постановки в очередь)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        metrics.watch_queue(self.queue)
+        self.accepting = False
+        self._tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            return web.Response(status=401)
+        if not self.accepting:
+            return web.Response(status=503)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+        try:
+            self.queue.put_nowait((update, time.monotonic()))
+        except asyncio.QueueFull:
+            logger.warning("Webhook queue is full, asking Telegram to retry")
+            return web.Response(status=503)
+        return web.Response(status=200)
+
+    async def _worker(self):
+        while True:
+            update, queued_at = await self.queue.get()
+            queue_wait = time.monotonic() - queued_at
+            metrics.observe_queue_wait(queue_wait)
+            try:
+                await self.dp.feed_update(self.bot, update, queue_wait=queue_wait)
+            except Exception:
+                logger.exception(f"Error processing update {update.update_id}")
+            finally:
+                self.queue.task_done()
+
+    async def start(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.accepting = True
+        logger.info(f"Webhook server listening on {host}:{port}{self.path}")
+
+    async def stop(self, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        # Перестаём принимать новые апдейты, дожидаемся обработки уже принятых
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Webhook drain timed out, {self.queue.qsize()} updates left unprocessed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    server = WebhookServer(dp, bot)
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    try:
+        await server.start()
+        if WEBHOOK_SET:
+            await bot.set_webhook(
+                f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=server.secret,
+                allowed_updates=dp.resolve_used_update_types(),
+                max_connections=WEBHOOK_WORKERS,
+            )
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        await stop.wait()
+        logger.info("Stopping webhook server...")
+        # Вебхук не удаляем: остальные реплики продолжают принимать апдейты
+        await server.stop()
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        await bot.session.close()
@@ -0,0 +1,70 @@
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+import cache
+
+logger = logging.getLogger(__name__)
+
+API_URL = os.getenv("API_URL", "http://backend:8000")
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "5"))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "20"))
+
+# Одна сессия с пулом keep-alive соединений на весь процесс дашборда
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+executor = ThreadPoolExecutor(max_workers=API_POOL_SIZE, thread_name_prefix="api")
+
+# Результат условного запроса, если данные на бэкенде не изменились (ответ 304)
+NOT_MODIFIED = object()
+
+def get_json(path, params=None, timeout=API_TIMEOUT, etag=None):
+    """GET с разбором JSON; возвращает (data, etag).
+
+    Если передан etag из прошлого ответа и данные не менялись, data - NOT_MODIFIED.
+    """
+    headers = {"If-None-Match": etag} if etag else None
+    with session.get(f"{API_URL}{path}", params=params, headers=headers, timeout=timeout, stream=True) as resp:
+        if resp.status_code == 304:
+            return NOT_MODIFIED, etag
+        resp.raise_for_status()
+        # NDJSON-эндпоинты (например /expenses/stream/) читаем построчно
+        if resp.headers.get("content-type", "").startswith("application/x-ndjson"):
+            return [json.loads(line) for line in resp.iter_lines() if line], resp.headers.get("etag")
+        return resp.json(), resp.headers.get("etag")
+
+def get_cached(path, params=None, timeout=API_TIMEOUT):
+    """GET через общий кэш воркеров: повторный запрос условный, на 304 данные берутся из кэша."""
+    key = ("api", path, tuple(sorted((params or {}).items())))
+    cached = cache.get(key)
+    data, etag = get_json(path, params, timeout, etag=cached[0] if cached else None)
+    if data is NOT_MODIFIED:
+        return cached[1]
+    if etag:
+        cache.put(key, (etag, data))
+    return data
+
+def fetch_many(calls, timeout=API_TIMEOUT, etags=None):
+    """Выполняет запросы параллельно: {name: (path, params)} -> ({name: data или None}, {name: etag}).
+
+    Ошибка одного запроса не роняет остальные - вместо данных возвращается None.
+    С etags (из прошлого вызова) неизменившиеся данные приходят как NOT_MODIFIED.
+    """
+    etags = etags or {}
+    futures = {
+        name: executor.submit(get_json, path, params, timeout, etags.get(name))
+        for name, (path, params) in calls.items()
+    }
+    results, new_etags = {}, {}
+    for name, future in futures.items():
+        try:
+            results[name], new_etags[name] = future.result()
+        except Exception as e:
+            logger.error(f"Error fetching {name}: {e}")
+            results[name], new_etags[name] = None, None
+    return results, new_etags
@@ -1,12 +1,9 @@
+import os
 import dash
-from dash import dcc, html, Input, Output, callback
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
-import requests
-from datetime import datetime, timedelta
-
-API_URL = "http://backend:8000"
+from dash import dcc, html, Input, Output, State, callback, ctx
+from dash.exceptions import PreventUpdate
+import api
+import figures
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 app.title = "Finance Tracker Dashboard"
@@ -115,24 +112,52 @@ app.index_string = '''
 app.layout = html.Div([
     dcc.Location(id='url', refresh=False),
     dcc.Interval(id='interval-component', interval=30*1000, n_intervals=0),
-    html.Div(id='page-content', className='container')
+    dcc.Store(id='etags'),
+    dcc.Store(id='page-state'),
+    html.Div([
+        html.Div(id='page-content'),
+        # Графики разбиты на вкладки и строятся только для открытой
+        dcc.Tabs(id='chart-tabs', value='overview', children=[
+            dcc.Tab(label=label, value=tab) for tab, (label, _) in figures.TABS.items()
+        ]),
+        dcc.Loading(html.Div(id='tab-content', className='charts-grid')),
+    ], className='container')
 ])
 
-@callback(Output('page-content', 'children'), [Input('url', 'search'), Input('interval-component', 'n_intervals')])
-def display_page(search, n):
+def format_amount(value):
+    return "—" if value is None else f"{value:.0f} ₽"
+
+DAYS = 30
+
+def parse_user_id(search):
     user_id = 123456  # Default
     if search:
         params = dict(item.split('=') for item in search[1:].split('&') if '=' in item)
         user_id = int(params.get('user_id', user_id))
+    return user_id
+
+def bundle_params(user_id):
+    return {'user_id': user_id, 'days': DAYS, 'include_expenses': 'false'}
+
+@callback(
+    [Output('page-content', 'children'), Output('etags', 'data'), Output('page-state', 'data')],
+    [Input('url', 'search'), Input('interval-component', 'n_intervals')],
+    [State('etags', 'data')]
+)
+def display_page(search, n, etags):
+    user_id = parse_user_id(search)
+    
+    # Агрегаты - одним запросом; упавший запрос даёт пустые графики, а не ошибку страницы.
+    # По таймеру запрос условный: если данные не менялись, страницу не перерисовываем.
+    calls = {'bundle': ('/dashboard/', bundle_params(user_id))}
+    data, etags = api.fetch_many(calls, etags=etags if ctx.triggered_id == 'interval-component' else None)
+    if data['bundle'] is api.NOT_MODIFIED:
+        raise PreventUpdate
     
     try:
-        # Получаем данные
-        summary = requests.get(f"{API_URL}/stats/summary/?user_id={user_id}").json()
-        balance = requests.get(f"{API_URL}/balance/?user_id={user_id}").json()
-        by_category = requests.get(f"{API_URL}/stats/by-category/?user_id={user_id}&days=30").json()
-        daily_stats = requests.get(f"{API_URL}/stats/daily/?user_id={user_id}&days=30").json()
-        monthly_stats = requests.get(f"{API_URL}/stats/monthly/?user_id={user_id}").json()
-        expenses = requests.get(f"{API_URL}/expenses/?user_id={user_id}").json()
+        bundle = data['bundle'] or {}
+        summary = bundle.get('summary')
+        balance = bundle.get('balance')
         
         # Header
         header = html.Div([
@@ -144,283 +169,56 @@ def display_page(search, n):
         stats_cards = html.Div([
             html.Div([
                 html.Div("📅 Сегодня", className='stat-label'),
-                html.Div(f"{summary['today']:.0f} ₽", className='stat-value')
+                html.Div(format_amount(summary and summary['today']), className='stat-value')
             ], className='stat-card'),
             html.Div([
                 html.Div("📅 За неделю", className='stat-label'),
-                html.Div(f"{summary['week']:.0f} ₽", className='stat-value')
+                html.Div(format_amount(summary and summary['week']), className='stat-value')
             ], className='stat-card'),
             html.Div([
                 html.Div("📅 За месяц", className='stat-label'),
-                html.Div(f"{summary['month']:.0f} ₽", className='stat-value')
+                html.Div(format_amount(summary and summary['month']), className='stat-value')
             ], className='stat-card'),
             html.Div([
                 html.Div("💼 Баланс", className='stat-label'),
                 html.Div(
-                    f"{balance['balance']:.0f} ₽",
+                    format_amount(balance and balance['balance']),
                     className='stat-value',
-                    style={'color': '#28a745' if balance['balance'] >= 0 else '#dc3545'}
+                    style={'color': '#28a745' if not balance or balance['balance'] >= 0 else '#dc3545'}
                 )
             ], className='stat-card'),
         ], className='stats-grid')
         
-        # Pie chart - По категориям
-        if by_category:
-            df_cat = pd.DataFrame(by_category)
-            fig_pie = px.pie(
-                df_cat,
-                values='total',
-                names='category',
-                title='Распределение расходов по категориям',
-                hole=0.4,
-                color_discrete_sequence=px.colors.qualitative.Set3
-            )
-            fig_pie.update_layout(height=450, showlegend=True)
-        else:
-            fig_pie = go.Figure()
-        
-        # Bar chart - По категориям
-        if by_category:
-            df_cat_sorted = df_cat.sort_values('total', ascending=True)
-            fig_bar = px.bar(
-                df_cat_sorted,
-                y='category',
-                x='total',
-                orientation='h',
-                title='Расходы по категориям (₽)',
-                color='total',
-                color_continuous_scale='Viridis'
-            )
-            fig_bar.update_layout(height=450, showlegend=False)
-        else:
-            fig_bar = go.Figure()
-        
-        # Line chart - Дневная динамика
-        if daily_stats:
-            df_daily = pd.DataFrame(daily_stats)
-            df_daily['date'] = pd.to_datetime(df_daily['date'])
-            fig_line = px.line(
-                df_daily,
-                x='date',
-                y='total',
-                title='Динамика расходов по дням',
-                markers=True
-            )
-            fig_line.update_traces(line_color='#667eea', line_width=3)
-            fig_line.update_layout(height=450)
-        else:
-            fig_line = go.Figure()
-        
-        # Area chart - Накопительная сумма
-        if daily_stats:
-            df_daily['cumulative'] = df_daily['total'].cumsum()
-            fig_area = px.area(
-                df_daily,
-                x='date',
-                y='cumulative',
-                title='Накопительные расходы',
-                color_discrete_sequence=['#764ba2']
-            )
-            fig_area.update_layout(height=450)
-        else:
-            fig_area = go.Figure()
-        
-        # Bubble chart
-        if by_category:
-            df_cat['size'] = df_cat['total'] / df_cat['total'].max() * 100
-            fig_bubble = px.scatter(
-                df_cat,
-                x='count',
-                y='total',
-                size='size',
-                color='category',
-                title='Bubble Chart: Частота vs Сумма',
-                labels={'count': 'Количество транзакций', 'total': 'Сумма (₽)'},
-                size_max=60
-            )
-            fig_bubble.update_layout(height=450)
-        else:
-            fig_bubble = go.Figure()
-        
-        # Sunburst chart
-        if expenses:
-            df_expenses = pd.DataFrame(expenses)
-            if not df_expenses.empty:
-                df_expenses['month'] = pd.to_datetime(df_expenses['date']).dt.strftime('%Y-%m')
-                fig_sunburst = px.sunburst(
-                    df_expenses,
-                    path=['month', 'category'],
-                    values='amount',
-                    title='Иерархия расходов: Месяц → Категория'
-                )
-                fig_sunburst.update_layout(height=450)
-            else:
-                fig_sunburst = go.Figure()
-        else:
-            fig_sunburst = go.Figure()
-        
-        # Treemap
-        if by_category:
-            fig_treemap = px.treemap(
-                df_cat,
-                path=['category'],
-                values='total',
-                title='Treemap расходов по категориям',
-                color='total',
-                color_continuous_scale='RdYlGn_r'
-            )
-            fig_treemap.update_layout(height=450)
-        else:
-            fig_treemap = go.Figure()
-        
-        # Monthly trend
-        if monthly_stats:
-            df_monthly = pd.DataFrame(monthly_stats)
-            df_monthly['period'] = df_monthly['year'].astype(str) + '-' + df_monthly['month'].astype(str).str.zfill(2)
-            fig_monthly = px.bar(
-                df_monthly,
-                x='period',
-                y='total',
-                title='Расходы по месяцам',
-                color='total',
-                color_continuous_scale='Blues'
-            )
-            fig_monthly.update_layout(height=450)
-        else:
-            fig_monthly = go.Figure()
-        
-        # Heatmap (если есть данные за несколько месяцев)
-        if expenses and len(expenses) > 10:
-            df_exp = pd.DataFrame(expenses)
-            df_exp['date'] = pd.to_datetime(df_exp['date'])
-            df_exp['weekday'] = df_exp['date'].dt.dayofweek
-            df_exp['week'] = df_exp['date'].dt.isocalendar().week
-            
-            heatmap_data = df_exp.groupby(['week', 'weekday'])['amount'].sum().reset_index()
-            pivot_table = heatmap_data.pivot(index='weekday', columns='week', values='amount').fillna(0)
-            
-            fig_heatmap = px.imshow(
-                pivot_table,
-                title='Heatmap расходов по дням недели',
-                labels={'x': 'Неделя', 'y': 'День недели', 'color': 'Сумма (₽)'},
-                color_continuous_scale='Reds',
-                aspect='auto'
-            )
-            fig_heatmap.update_layout(height=450)
-        else:
-            fig_heatmap = go.Figure()
-        
-        # Box plot
-        if expenses:
-            df_exp = pd.DataFrame(expenses)
-            fig_box = px.box(
-                df_exp,
-                x='category',
-                y='amount',
-                title='Распределение сумм по категориям (Box Plot)',
-                color='category'
-            )
-            fig_box.update_layout(height=450, showlegend=False)
-        else:
-            fig_box = go.Figure()
-        
-        # Violin plot
-        if expenses:
-            fig_violin = px.violin(
-                df_exp,
-                x='category',
-                y='amount',
-                title='Violin Plot распределения расходов',
-                color='category',
-                box=True
-            )
-            fig_violin.update_layout(height=450, showlegend=False)
-        else:
-            fig_violin = go.Figure()
-        
-        # Funnel chart - топ категории
-        if by_category:
-            df_cat_top = df_cat.nlargest(7, 'total')
-            fig_funnel = px.funnel(
-                df_cat_top,
-                x='total',
-                y='category',
-                title='Funnel Chart топовых категорий'
-            )
-            fig_funnel.update_layout(height=450)
-        else:
-            fig_funnel = go.Figure()
-        
-        # Charts grid
-        charts = html.Div([
-            html.Div([
-                html.Div("🥧 Распределение по категориям", className='chart-title'),
-                dcc.Graph(figure=fig_pie, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("📊 Расходы по категориям", className='chart-title'),
-                dcc.Graph(figure=fig_bar, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("📈 Дневная динамика", className='chart-title'),
-                dcc.Graph(figure=fig_line, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("📉 Накопительные расходы", className='chart-title'),
-                dcc.Graph(figure=fig_area, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("🫧 Частота vs Сумма", className='chart-title'),
-                dcc.Graph(figure=fig_bubble, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("☀️ Иерархия расходов", className='chart-title'),
-                dcc.Graph(figure=fig_sunburst, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("🗺️ Treemap категорий", className='chart-title'),
-                dcc.Graph(figure=fig_treemap, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("📅 Месячный тренд", className='chart-title'),
-                dcc.Graph(figure=fig_monthly, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("🔥 Heatmap активности", className='chart-title'),
-                dcc.Graph(figure=fig_heatmap, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("📦 Box Plot распределения", className='chart-title'),
-                dcc.Graph(figure=fig_box, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("🎻 Violin Plot", className='chart-title'),
-                dcc.Graph(figure=fig_violin, config={'displayModeBar': False})
-            ], className='chart-container'),
-            
-            html.Div([
-                html.Div("🎯 Funnel топовых категорий", className='chart-title'),
-                dcc.Graph(figure=fig_funnel, config={'displayModeBar': False})
-            ], className='chart-container'),
-        ], className='charts-grid')
-        
-        return [header, stats_cards, charts]
+        # Смена версии данных перерисовывает открытую вкладку графиков
+        page_state = {'user_id': user_id, 'version': etags.get('bundle')}
+        return [header, stats_cards], etags, page_state
     
     except Exception as e:
         return html.Div([
             html.H1("❌ Ошибка загрузки данных"),
             html.P(f"Детали: {str(e)}")
-        ])
+        ]), None, None
+
+@callback(Output('tab-content', 'children'), [Input('chart-tabs', 'value'), Input('page-state', 'data')])
+def display_tab(tab, page_state):
+    if not page_state:
+        raise PreventUpdate
+    user_id = page_state['user_id']
+    
+    charts = figures.tab_figures(
+        tab, user_id, page_state['version'], DAYS,
+        lambda: figures.load_chart_data(user_id, bundle_params(user_id))
+    )
+    return [
+        html.Div([
+            html.Div(title, className='chart-title'),
+            dcc.Graph(figure=figure, config={'displayModeBar': False})
+        ], className='chart-container')
+        for title, figure in charts
+    ]
+
+# WSGI-приложение для gunicorn (app:server); run_server ниже - только для локальной разработки
+server = app.server
 
 if __name__ == '__main__':
-    app.run_server(host='0.0.0.0', port=8050, debug=True)
+    app.run_server(host='0.0.0.0', port=8050, debug=os.getenv("DASH_DEBUG", "false").lower() in ("1", "true", "yes"))
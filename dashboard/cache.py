@@ -0,0 +1,23 @@
+import os
+import diskcache
+
+# Общий для всех воркеров gunicorn кэш на диске (SQLite + файлы): ответы бэкенда
+# и построенные графики. Вытеснение - LRU по суммарному размеру.
+CACHE_DIR = os.getenv("DASH_CACHE_DIR", "/tmp/dash-cache")
+CACHE_SIZE_MB = int(os.getenv("DASH_CACHE_SIZE_MB", "512"))
+CACHE_TTL = int(os.getenv("DASH_CACHE_TTL", "86400"))
+
+cache = diskcache.FanoutCache(
+    CACHE_DIR,
+    shards=8,
+    timeout=1,
+    size_limit=CACHE_SIZE_MB * 1024 * 1024,
+    eviction_policy="least-recently-used",
+)
+
+def get(key, default=None):
+    return cache.get(key, default=default)
+
+def put(key, value, expire=CACHE_TTL):
+    # При занятой блокировке шарда FanoutCache не ждёт, а просто не сохраняет значение
+    cache.set(key, value, expire=expire)
@@ -0,0 +1,298 @@
+import logging
+from collections import OrderedDict
+import plotly.express as px
+import plotly.graph_objects as go
+import numpy as np
+import pandas as pd
+import api
+import cache
+
+logger = logging.getLogger(__name__)
+
+class ChartData:
+    """Данные для графиков одного пользователя: бандл агрегатов и (лениво) сводки распределений."""
+
+    def __init__(self, user_id, bundle):
+        self.user_id = user_id
+        self.bundle = bundle or {}
+        self.by_category = pd.DataFrame(self.bundle.get('by_category') or [])
+        self.daily = pd.DataFrame(self.bundle.get('daily') or [])
+        self.monthly = pd.DataFrame(self.bundle.get('monthly') or [])
+        windows = self.bundle.get('windows') or []
+        self.expense_count = next((w['expense_count'] for w in windows if w['name'] == 'all'), 0)
+        self._loaded = {}
+
+    def _load(self, path):
+        # Сводки запрашиваются только для вкладок, которые их показывают
+        if path not in self._loaded:
+            try:
+                self._loaded[path] = pd.DataFrame(api.get_cached(path, {'user_id': self.user_id}))
+            except Exception as e:
+                logger.error(f"Error fetching {path}: {e}")
+                self._loaded[path] = pd.DataFrame()
+        return self._loaded[path]
+
+    @property
+    def month_category(self):
+        return self._load('/stats/month-category/')
+
+    @property
+    def week_weekday(self):
+        return self._load('/stats/week-weekday/')
+
+    @property
+    def distribution(self):
+        return self._load('/stats/distribution/')
+
+def load_chart_data(user_id, params):
+    try:
+        bundle = api.get_cached('/dashboard/', params)
+    except Exception as e:
+        logger.error(f"Error fetching dashboard bundle: {e}")
+        bundle = None
+    return ChartData(user_id, bundle)
+
+def pie(data):
+    if data.by_category.empty:
+        return go.Figure()
+    fig = px.pie(
+        data.by_category,
+        values='total',
+        names='category',
+        title='Распределение расходов по категориям',
+        hole=0.4,
+        color_discrete_sequence=px.colors.qualitative.Set3
+    )
+    fig.update_layout(height=450, showlegend=True)
+    return fig
+
+def category_bar(data):
+    if data.by_category.empty:
+        return go.Figure()
+    fig = px.bar(
+        data.by_category.sort_values('total', ascending=True),
+        y='category',
+        x='total',
+        orientation='h',
+        title='Расходы по категориям (₽)',
+        color='total',
+        color_continuous_scale='Viridis'
+    )
+    fig.update_layout(height=450, showlegend=False)
+    return fig
+
+def daily_line(data):
+    if data.daily.empty:
+        return go.Figure()
+    fig = px.line(
+        data.daily.assign(date=pd.to_datetime(data.daily['date'])),
+        x='date',
+        y='total',
+        title='Динамика расходов по дням',
+        markers=True
+    )
+    fig.update_traces(line_color='#667eea', line_width=3)
+    fig.update_layout(height=450)
+    return fig
+
+def cumulative_area(data):
+    if data.daily.empty:
+        return go.Figure()
+    fig = px.area(
+        data.daily.assign(date=pd.to_datetime(data.daily['date']), cumulative=data.daily['total'].cumsum()),
+        x='date',
+        y='cumulative',
+        title='Накопительные расходы',
+        color_discrete_sequence=['#764ba2']
+    )
+    fig.update_layout(height=450)
+    return fig
+
+def bubble(data):
+    if data.by_category.empty:
+        return go.Figure()
+    df_cat = data.by_category
+    fig = px.scatter(
+        df_cat.assign(size=df_cat['total'] / df_cat['total'].max() * 100),
+        x='count',
+        y='total',
+        size='size',
+        color='category',
+        title='Bubble Chart: Частота vs Сумма',
+        labels={'count': 'Количество транзакций', 'total': 'Сумма (₽)'},
+        size_max=60
+    )
+    fig.update_layout(height=450)
+    return fig
+
+def sunburst(data):
+    if data.month_category.empty:
+        return go.Figure()
+    fig = px.sunburst(
+        data.month_category,
+        path=['month', 'category'],
+        values='total',
+        title='Иерархия расходов: Месяц → Категория'
+    )
+    fig.update_layout(height=450)
+    return fig
+
+def treemap(data):
+    if data.by_category.empty:
+        return go.Figure()
+    fig = px.treemap(
+        data.by_category,
+        path=['category'],
+        values='total',
+        title='Treemap расходов по категориям',
+        color='total',
+        color_continuous_scale='RdYlGn_r'
+    )
+    fig.update_layout(height=450)
+    return fig
+
+def funnel(data):
+    if data.by_category.empty:
+        return go.Figure()
+    fig = px.funnel(
+        data.by_category.nlargest(7, 'total'),
+        x='total',
+        y='category',
+        title='Funnel Chart топовых категорий'
+    )
+    fig.update_layout(height=450)
+    return fig
+
+def monthly_bar(data):
+    if data.monthly.empty:
+        return go.Figure()
+    df_monthly = data.monthly
+    fig = px.bar(
+        df_monthly.assign(period=df_monthly['year'].astype(str) + '-' + df_monthly['month'].astype(str).str.zfill(2)),
+        x='period',
+        y='total',
+        title='Расходы по месяцам',
+        color='total',
+        color_continuous_scale='Blues'
+    )
+    fig.update_layout(height=450)
+    return fig
+
+def heatmap(data):
+    # Только если есть данные за несколько месяцев
+    if data.expense_count <= 10 or data.week_weekday.empty:
+        return go.Figure()
+    pivot_table = data.week_weekday.pivot(index='weekday', columns='week', values='total').fillna(0)
+    fig = px.imshow(
+        pivot_table,
+        title='Heatmap расходов по дням недели',
+        labels={'x': 'Неделя', 'y': 'День недели', 'color': 'Сумма (₽)'},
+        color_continuous_scale='Reds',
+        aspect='auto'
+    )
+    fig.update_layout(height=450)
+    return fig
+
+# Box и violin строятся по готовым квартилям и KDE с бэкенда, а не по сырым строкам
+COLORS = px.colors.qualitative.Plotly
+
+def box(data):
+    if data.distribution.empty:
+        return go.Figure()
+    fig = go.Figure()
+    for i, d in enumerate(data.distribution.itertuples()):
+        color = COLORS[i % len(COLORS)]
+        fig.add_trace(go.Box(
+            x=[d.category], q1=[d.q1], median=[d.median], q3=[d.q3], mean=[d.mean],
+            lowerfence=[d.lower_whisker], upperfence=[d.upper_whisker],
+            name=d.category, marker_color=color
+        ))
+        if d.outliers:
+            fig.add_trace(go.Scatter(
+                x=[d.category] * len(d.outliers), y=d.outliers, mode='markers',
+                marker_color=color, showlegend=False, hoverinfo='y'
+            ))
+    fig.update_layout(
+        height=450, showlegend=False, title='Распределение сумм по категориям (Box Plot)',
+        xaxis_title='category', yaxis_title='amount'
+    )
+    return fig
+
+def violin(data):
+    if data.distribution.empty:
+        return go.Figure()
+    fig = go.Figure()
+    for i, d in enumerate(data.distribution.itertuples()):
+        color = COLORS[i % len(COLORS)]
+        # Контур скрипки - KDE, отражённая в обе стороны от позиции категории
+        y = np.asarray(d.kde_y)
+        half = y / y.max() * 0.4 if y.max() > 0 else y
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([i - half, (i + half)[::-1]]),
+            y=np.concatenate([d.kde_x, d.kde_x[::-1]]),
+            fill='toself', mode='lines', line_color=color, name=d.category, hoverinfo='name'
+        ))
+        # Внутренний box: усы, межквартильный размах и медиана
+        fig.add_trace(go.Scatter(
+            x=[i, i], y=[d.lower_whisker, d.upper_whisker], mode='lines',
+            line=dict(color='#444', width=1), showlegend=False, hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=[i, i], y=[d.q1, d.q3], mode='lines',
+            line=dict(color='#444', width=6), showlegend=False, hoverinfo='skip'
+        ))
+        fig.add_trace(go.Scatter(
+            x=[i], y=[d.median], mode='markers', marker=dict(color='white', size=6),
+            showlegend=False, hovertemplate=f'{d.category}: медиана %{{y}}<extra></extra>'
+        ))
+    categories = data.distribution['category'].tolist()
+    fig.update_layout(
+        height=450, showlegend=False, title='Violin Plot распределения расходов',
+        xaxis=dict(tickmode='array', tickvals=list(range(len(categories))), ticktext=categories, title='category'),
+        yaxis_title='amount'
+    )
+    return fig
+
+# Вкладки: id -> (подпись, [(заголовок, построитель)]). Первая видна при открытии страницы.
+TABS = OrderedDict([
+    ('overview', ("📊 Обзор", [
+        ("🥧 Распределение по категориям", pie),
+        ("📊 Расходы по категориям", category_bar),
+        ("📈 Дневная динамика", daily_line),
+        ("📉 Накопительные расходы", cumulative_area),
+    ])),
+    ('categories', ("📂 Категории", [
+        ("🫧 Частота vs Сумма", bubble),
+        ("☀️ Иерархия расходов", sunburst),
+        ("🗺️ Treemap категорий", treemap),
+        ("🎯 Funnel топовых категорий", funnel),
+    ])),
+    ('trends', ("📅 Тренды", [
+        ("📅 Месячный тренд", monthly_bar),
+        ("🔥 Heatmap активности", heatmap),
+    ])),
+    ('distribution', ("📦 Распределение", [
+        ("📦 Box Plot распределения", box),
+        ("🎻 Violin Plot", violin),
+    ])),
+])
+
+def build_tab(tab, data):
+    return [(title, build(data).to_dict()) for title, build in TABS[tab][1]]
+
+def tab_figures(tab, user_id, version, days, load_data):
+    """Графики вкладки как [(заголовок, figure dict)], с мемоизацией по (user, version, days, tab).
+
+    Кэш общий для воркеров, поэтому обновление попадает в тёплый кэш на любом из них.
+    load_data() вызывается только при промахе. Без версии (бэкенд не вернул ETag) не кэшируем.
+    """
+    key = ("figures", user_id, version, days, tab)
+    if version is not None:
+        figures = cache.get(key)
+        if figures is not None:
+            return figures
+
+    figures = build_tab(tab, load_data())
+    if version is not None:
+        cache.put(key, figures)
+    return figures
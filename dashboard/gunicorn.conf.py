@@ -0,0 +1,14 @@
+import multiprocessing
+import os
+
+# Продакшен-запуск дашборда: gunicorn -c gunicorn.conf.py app:server
+bind = f"0.0.0.0:{os.getenv('DASH_PORT', '8050')}"
+workers = int(os.getenv("DASH_WORKERS", str(multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv("DASH_THREADS", "4"))
+worker_class = "gthread"
+timeout = int(os.getenv("DASH_TIMEOUT", "60"))
+keepalive = 5
+# Перезапуск воркеров ограничивает рост памяти от pandas/plotly
+max_requests = int(os.getenv("DASH_MAX_REQUESTS", "1000"))
+max_requests_jitter = 100
+accesslog = "-"
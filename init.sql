@@ -1,25 +1,64 @@
+-- Справочник категорий: в расходах и агрегатах хранится smallint id, а не текст
+CREATE TABLE IF NOT EXISTS categories (
+    id SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
+
+-- Категории каждого пользователя для /categories/
+CREATE TABLE IF NOT EXISTS user_categories (
+    user_id BIGINT NOT NULL,
+    category_id SMALLINT NOT NULL REFERENCES categories(id),
+    PRIMARY KEY (user_id, category_id)
+);
+
+-- Расходы и доходы секционированы по месяцам (partitions.py): партиции
+-- expenses_YYYY_MM / income_YYYY_MM создаёт бэкенд при старте и перед вставкой
 CREATE TABLE IF NOT EXISTS expenses (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id BIGINT NOT NULL,  -- ← BIGINT
     amount FLOAT NOT NULL,
-    category VARCHAR(100) NOT NULL,
+    category_id SMALLINT NOT NULL REFERENCES categories(id),
     description TEXT,
     date DATE NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
-);
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    idempotency_key VARCHAR(64),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
 
 CREATE TABLE IF NOT EXISTS income (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     user_id BIGINT NOT NULL,  -- ← BIGINT
     amount FLOAT NOT NULL,
     source VARCHAR(100) NOT NULL,
     description TEXT,
     date DATE NOT NULL,
-    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    idempotency_key VARCHAR(64),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+CREATE INDEX ix_expenses_user_date ON expenses (user_id, date);
+CREATE INDEX ix_expenses_user_category_date ON expenses (user_id, category_id, date) INCLUDE (amount);
+CREATE INDEX ix_income_user_date ON income (user_id, date) INCLUDE (amount);
+CREATE UNIQUE INDEX ix_expenses_idempotency_key ON expenses (idempotency_key, date);
+CREATE UNIQUE INDEX ix_income_idempotency_key ON income (idempotency_key, date);
+
+-- Агрегаты для /stats/*, обновляются вместе со вставкой расходов/доходов
+CREATE TABLE IF NOT EXISTS expense_daily_rollup (
+    user_id BIGINT NOT NULL,
+    day DATE NOT NULL,
+    category_id SMALLINT NOT NULL REFERENCES categories(id),
+    total FLOAT NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day, category_id)
 );
 
-CREATE INDEX idx_expenses_user_id ON expenses(user_id);
-CREATE INDEX idx_expenses_date ON expenses(date);
-CREATE INDEX idx_expenses_category ON expenses(category);
-CREATE INDEX idx_income_user_id ON income(user_id);
-CREATE INDEX idx_income_date ON income(date);
+CREATE TABLE IF NOT EXISTS user_totals (
+    user_id BIGINT PRIMARY KEY,
+    income_total FLOAT NOT NULL DEFAULT 0,
+    income_count INTEGER NOT NULL DEFAULT 0,
+    expense_total FLOAT NOT NULL DEFAULT 0,
+    expense_count INTEGER NOT NULL DEFAULT 0,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import date, datetime, timezone
+import aiohttp
+
+# Нагрузочный прогон против запущенного бэкенда. Имитирует два вида клиентов:
+# - пользователей бота: диалог ExpenseStates (сумма -> категория -> описание) и добавление
+#   дохода заканчиваются записью операции, команды "Статистика" и "Баланс" - те же GET,
+#   что делают render_stats и render_balance. Запись по умолчанию идёт как у бота -
+#   через outbox пачками в /expenses/bulk/ и /income/bulk/ раз в --outbox-interval секунд,
+#   с --writes direct - отдельным POST /expenses/ и /income/ на каждую операцию;
+# - открытые вкладки дашборда: каждые --dashboard-interval секунд условный GET /dashboard/
+#   (как display_page), а при изменении данных - загрузка открытой вкладки графиков.
+# Результат - пропускная способность и p50/p95/p99 по каждому эндпоинту, в JSON для
+# сравнения между релизами (команда compare).
+
+CATEGORIES = ["Еда", "Транспорт", "Жилье", "Развлечения", "Одежда", "Здоровье", "Образование", "Подарки", "Другое"]
+SOURCES = ["Зарплата", "Фриланс", "Подарок", "Инвестиции", "Другое"]
+
+# Действия пользователя бота и их доли
+BOT_ACTIONS = [("expense", 0.6), ("income", 0.1), ("stats", 0.2), ("balance", 0.1)]
+
+# Эндпоинты, которые дашборд дополнительно запрашивает для вкладки графиков
+TAB_PATHS = {
+    "overview": [],
+    "categories": ["/stats/month-category/"],
+    "trends": ["/stats/week-weekday/"],
+    "distribution": ["/stats/distribution/"],
+}
+
+def percentile(values, q):
+    # Ближайший ранг по отсортированному списку
+    if not values:
+        return None
+    return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+class Recorder:
+    """Задержки и статусы по эндпоинтам (ключ - "METHOD /path/")."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def add(self, key, seconds, status):
+        self.latencies[key].append(seconds)
+        self.statuses[key][str(status)] += 1
+        if not isinstance(status, int) or status >= 400:
+            self.errors[key] += 1
+
+    def summary(self, duration):
+        def stats(values, errors, statuses):
+            values = sorted(values)
+            return {
+                "requests": len(values),
+                "errors": errors,
+                "statuses": dict(statuses),
+                "throughput_rps": round(len(values) / duration, 2),
+                "mean_ms": round(sum(values) / len(values) * 1000, 2) if values else None,
+                "p50_ms": _ms(percentile(values, 50)),
+                "p95_ms": _ms(percentile(values, 95)),
+                "p99_ms": _ms(percentile(values, 99)),
+                "max_ms": _ms(values[-1] if values else None),
+            }
+
+        endpoints = {
+            key: stats(self.latencies[key], self.errors[key], self.statuses[key])
+            for key in sorted(self.latencies)
+        }
+        total_statuses = defaultdict(int)
+        for statuses in self.statuses.values():
+            for status, count in statuses.items():
+                total_statuses[status] += count
+        everything = [v for values in self.latencies.values() for v in values]
+        return endpoints, stats(everything, sum(self.errors.values()), total_statuses)
+
+def _ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+class Client:
+    def __init__(self, session, api_url, recorder, timeout):
+        self.session = session
+        self.api_url = api_url.rstrip("/")
+        self.recorder = recorder
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async def request(self, method, path, *, params=None, json=None, etag=None):
+        """Выполняет запрос и пишет задержку; возвращает (status, etag) или (None, None) при ошибке."""
+        headers = {"If-None-Match": etag} if etag else None
+        started = time.perf_counter()
+        try:
+            async with self.session.request(method, self.api_url + path, params=params, json=json,
+                                            headers=headers, timeout=self.timeout) as resp:
+                await resp.read()
+                status, new_etag = resp.status, resp.headers.get("ETag")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.recorder.add(f"{method} {path}", time.perf_counter() - started, type(e).__name__)
+            return None, None
+        self.recorder.add(f"{method} {path}", time.perf_counter() - started, status)
+        return status, new_etag
+
+class Writer:
+    """Запись операций: сразу или, как outbox бота, пачками по таймеру."""
+
+    PATHS = {"expense": "/expenses/", "income": "/income/"}
+
+    def __init__(self, client, mode, interval, batch_size):
+        self.client = client
+        self.mode = mode
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = {kind: [] for kind in self.PATHS}
+
+    async def write(self, kind, payload):
+        if self.mode == "direct":
+            await self.client.request("POST", self.PATHS[kind], json=payload)
+        else:
+            self.pending[kind].append(payload)
+
+    async def flush(self):
+        for kind, path in self.PATHS.items():
+            while self.pending[kind]:
+                batch = self.pending[kind][:self.batch_size]
+                del self.pending[kind][:self.batch_size]
+                await self.client.request("POST", path + "bulk/", json=batch)
+
+    async def run(self, deadline):
+        if self.mode == "direct":
+            return
+        while time.monotonic() < deadline:
+            await asyncio.sleep(max(0.0, min(self.interval, deadline - time.monotonic())))
+            await self.flush()
+
+async def think(mean):
+    await asyncio.sleep(random.expovariate(1 / mean) if mean > 0 else 0)
+
+async def bot_user(client, writer, user_id, deadline, think_time):
+    actions, weights = zip(*BOT_ACTIONS)
+    while time.monotonic() < deadline:
+        action = random.choices(actions, weights)[0]
+        if action == "expense":
+            # Три сообщения диалога: сумма, категория, описание - запрос только в конце
+            for _ in range(3):
+                await think(think_time)
+            await writer.write("expense", {
+                "user_id": user_id,
+                "amount": round(random.lognormvariate(6, 1), 2),
+                "category": random.choice(CATEGORIES),
+                "description": None,
+                "date": date.today().isoformat(),
+                "idempotency_key": uuid.uuid4().hex,
+            })
+        elif action == "income":
+            for _ in range(3):
+                await think(think_time)
+            await writer.write("income", {
+                "user_id": user_id,
+                "amount": round(random.uniform(10_000, 100_000), 2),
+                "source": random.choice(SOURCES),
+                "description": None,
+                "date": date.today().isoformat(),
+                "idempotency_key": uuid.uuid4().hex,
+            })
+        elif action == "stats":
+            await think(think_time)
+            await asyncio.gather(
+                client.request("GET", "/stats/windows/", params=[
+                    ("user_id", str(user_id)), ("windows", "today"), ("windows", "week"), ("windows", "month")
+                ]),
+                client.request("GET", "/stats/by-category/", params={"user_id": user_id, "days": 30}),
+            )
+        else:
+            await think(think_time)
+            await client.request("GET", "/balance/", params={"user_id": user_id})
+
+async def dashboard_tab(client, user_id, deadline, interval):
+    params = {"user_id": user_id, "days": 30, "include_expenses": "false"}
+    tab = random.choice(list(TAB_PATHS))
+    etags = {}
+    # Вкладки открываются не одновременно
+    await asyncio.sleep(random.uniform(0, interval))
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        status, etag = await client.request("GET", "/dashboard/", params=params, etag=etags.get("bundle"))
+        if status == 200:
+            etags["bundle"] = etag
+            # Новая версия данных - вкладка графиков перестраивается по своим сводкам
+            for path in ["/dashboard/", *TAB_PATHS[tab]]:
+                status, etag = await client.request("GET", path, params=params if path == "/dashboard/" else {"user_id": user_id},
+                                                    etag=etags.get(path))
+                if status == 200:
+                    etags[path] = etag
+        await asyncio.sleep(max(0.0, min(started + interval, deadline) - time.monotonic()))
+
+async def run(args):
+    recorder = Recorder()
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    started_at = datetime.now(timezone.utc)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        client = Client(session, args.api_url, recorder, args.timeout)
+        user_ids = [args.user_id_base + i for i in range(args.bot_users)]
+        started = time.monotonic()
+        deadline = started + args.duration
+        writer = Writer(client, args.writes, args.outbox_interval, args.outbox_batch_size)
+        tasks = [writer.run(deadline)]
+        tasks += [bot_user(client, writer, user_id, deadline, args.think_time) for user_id in user_ids]
+        # Дашборды смотрят на тех же пользователей, чтобы записи бота меняли их данные
+        tasks += [
+            dashboard_tab(client, random.choice(user_ids) if user_ids else args.user_id_base + i, deadline, args.dashboard_interval)
+            for i in range(args.dashboards)
+        ]
+        await asyncio.gather(*tasks)
+        # Записи, накопленные после последнего сброса
+        await writer.flush()
+        duration = time.monotonic() - started
+
+    endpoints, total = recorder.summary(duration)
+    return {
+        "label": args.label,
+        "started_at": started_at.isoformat(),
+        "api_url": args.api_url,
+        "config": {
+            "bot_users": args.bot_users,
+            "dashboards": args.dashboards,
+            "duration": args.duration,
+            "think_time": args.think_time,
+            "dashboard_interval": args.dashboard_interval,
+            "writes": args.writes,
+            "outbox_interval": args.outbox_interval,
+            "connections": args.connections,
+        },
+        "duration_s": round(duration, 2),
+        "total": total,
+        "endpoints": endpoints,
+    }
+
+def print_report(result):
+    print(f"{result['label'] or 'run'}: {result['duration_s']} s, "
+          f"{result['total']['requests']} requests, {result['total']['throughput_rps']} rps, "
+          f"{result['total']['errors']} errors")
+    print(f"{'endpoint':<32}{'req':>8}{'rps':>9}{'err':>6}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for key, s in result["endpoints"].items():
+        print(f"{key:<32}{s['requests']:>8}{s['throughput_rps']:>9}{s['errors']:>6}"
+              f"{s['p50_ms']:>9}{s['p95_ms']:>9}{s['p99_ms']:>9}")
+
+def compare(baseline, current):
+    """Печатает изменение пропускной способности и перцентилей относительно baseline."""
+    def change(old, new):
+        if old is None or new is None or not old:
+            return "—"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"{'endpoint':<32}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    rows = [("total", baseline["total"], current["total"])]
+    rows += [
+        (key, baseline["endpoints"][key], current["endpoints"][key])
+        for key in sorted(set(baseline["endpoints"]) & set(current["endpoints"]))
+    ]
+    for key, old, new in rows:
+        print(f"{key:<32}{change(old['throughput_rps'], new['throughput_rps']):>10}"
+              + "".join(f"{change(old[m], new[m]):>10}" for m in ("p50_ms", "p95_ms", "p99_ms")))
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон: пользователи бота и вкладки дашборда")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="запустить прогон")
+    run_parser.add_argument("--api-url", default=os.getenv("API_URL", "http://localhost:8000"))
+    run_parser.add_argument("--bot-users", type=int, default=50, help="одновременных пользователей бота")
+    run_parser.add_argument("--dashboards", type=int, default=10, help="открытых вкладок дашборда")
+    run_parser.add_argument("--duration", type=float, default=60, help="длительность, с")
+    run_parser.add_argument("--think-time", type=float, default=2.0, help="средняя пауза пользователя между сообщениями, с")
+    run_parser.add_argument("--dashboard-interval", type=float, default=30, help="период обновления дашборда, с")
+    run_parser.add_argument("--writes", choices=["outbox", "direct"], default="outbox",
+                            help="запись операций пачками через bulk, как бот, или по одной")
+    run_parser.add_argument("--outbox-interval", type=float, default=5, help="период сброса outbox, с")
+    run_parser.add_argument("--outbox-batch-size", type=int, default=500, help="максимум записей в пачке")
+    run_parser.add_argument("--user-id-base", type=int, default=900_000_000, help="первый user_id тестовых пользователей")
+    run_parser.add_argument("--connections", type=int, default=100, help="максимум одновременных соединений")
+    run_parser.add_argument("--timeout", type=float, default=30, help="таймаут запроса, с")
+    run_parser.add_argument("--label", default="", help="метка прогона, например версия релиза")
+    run_parser.add_argument("--output", help="куда сохранить результат в JSON")
+
+    compare_parser = subparsers.add_parser("compare", help="сравнить два сохранённых прогона")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        compare(baseline, current)
+        return
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Saved to {args.output}")
+    if result["total"]["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()